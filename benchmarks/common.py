@@ -0,0 +1,17 @@
+import os
+import subprocess
+
+
+def percentile(values, fraction):
+    """最近排名法的百分位數，values 不需事先排序"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def git_revision():
+    """目前的 commit，用來標示結果屬於哪個版本；不在 git 工作目錄中時回傳 None"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
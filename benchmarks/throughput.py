@@ -0,0 +1,217 @@
+"""端對端字幕翻譯吞吐量測試
+
+    python -m benchmarks.throughput --sizes 100 1000 5000 20000 --output bench.json
+    python -m benchmarks.throughput --batch-size 8 --compare bench.json
+
+產生指定句數的合成 SRT 檔，以 TranslationJob 與 TranslationDispatcher 對內建的替身伺服器
+（srt_translator.mock_server）完整翻譯一次，記錄：
+  cues_per_second        每秒完成的字幕句數
+  latency_p50/p95/p99    單一請求從送出到收完回應的秒數
+  load_cpu_seconds       讀取與解析字幕檔（含去重、建立佇列）的 CPU 時間
+  save_cpu_seconds       寫出翻譯結果的 CPU 時間
+  peak_rss_mb            最高記憶體用量
+每種句數在獨立的子行程中執行，peak_rss_mb 才不會被前一輪墊高。
+結果連同目前的 commit 與所有設定寫成 JSON，--compare 可列出與先前結果的差異。
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.common import git_revision, percentile
+from srt_translator.backends import BACKENDS
+from srt_translator.dispatcher import POLICY_NAMES, TranslationDispatcher
+from srt_translator.job import TranslationJob
+from srt_translator.mock_server import MockOllamaServer
+from srt_translator.ollama_client import AsyncOllamaClient
+from srt_translator.prompts import SYSTEM_PROMPTS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = [100, 1000, 5000, 20000]
+
+# 合成字幕的用字
+_WORDS = ["ちょっと", "待って", "本当に", "ありがとう", "大丈夫", "行こう", "どうして", "もう", "一回",
+          "気持ち", "いい", "好き", "だめ", "ここ", "あなた", "私", "今日", "明日", "…", "！", "？"]
+
+
+class BenchmarkJob(TranslationJob):
+    """記錄讀取與存檔 CPU 時間的翻譯工作，輸出檔已存在時直接覆寫"""
+
+    system_prompt = SYSTEM_PROMPTS["general"]
+    keep_alive = None
+
+    def load(self):
+        started = time.thread_time()
+        super().load()
+        self.load_cpu = time.thread_time() - started
+
+    def finish(self):
+        started = time.thread_time()
+        super().finish()
+        self.save_cpu = time.thread_time() - started
+
+    def handle_file_conflict(self, file_path):
+        return "overwrite"
+
+
+class LatencyRecorder:
+    """當作客戶端的 observer，收集每個請求的延遲"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+
+    def record(self, started, tokens):
+        self.latencies.append(time.monotonic() - started)
+
+    def record_error(self, started):
+        self.errors += 1
+
+
+def write_synthetic_srt(path, cues, duplicate_ratio=0.0, seed=0):
+    """產生 cues 句的 SRT 檔，duplicate_ratio 比例的字幕重複先前出現過的內容"""
+    rng = random.Random(seed)
+    blocks = []
+    texts = []
+    for index in range(cues):
+        if texts and rng.random() < duplicate_ratio:
+            text = rng.choice(texts)
+        else:
+            lines = 2 if rng.random() < 0.2 else 1
+            text = "\n".join("".join(rng.choice(_WORDS) for _ in range(rng.randint(1, 6))) for _ in range(lines))
+            texts.append(text)
+        start = index * 2000
+        blocks.append(f"{index + 1}\n{_timestamp(start)} --> {_timestamp(start + 1500)}\n{text}\n\n")
+    with open(path, "w", encoding='utf-8', newline="") as f:
+        f.write("".join(blocks))
+
+
+def _timestamp(milliseconds):
+    """毫秒轉成 SRT 的 時:分:秒,毫秒"""
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+
+
+def run_size(cues, args, url, results):
+    """在子行程中翻譯一個 cues 句的合成檔，結果放進 results 佇列"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"bench_{cues}.srt")
+        write_synthetic_srt(path, cues, args.duplicates, args.seed)
+
+        recorder = LatencyRecorder()
+        client = AsyncOllamaClient(url, pool_size=args.parallel, timeout=60, observer=recorder,
+                                   backend=BACKENDS[args.backend]())
+        dispatcher = TranslationDispatcher(args.parallel, args.policy, exit_when_idle=True)
+        messages = []
+        job = BenchmarkJob(path, "日文", "繁體中文", "mock", args.parallel, lambda *a: None, messages.append,
+                           client, args.batch_size, None, not args.no_dedupe, not args.no_stream)
+
+        started = time.perf_counter()
+        dispatcher.submit(job)
+        dispatcher.run()
+        elapsed = time.perf_counter() - started
+
+    latencies = recorder.latencies or [0.0]
+    peak_rss_mb = None
+    if resource is not None:
+        # Linux 以 KB 回報，macOS 以 byte 回報
+        scale = 1024 * 1024 if platform.system() == "Darwin" else 1024
+        peak_rss_mb = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+    results.put({
+        "cues": cues,
+        "seconds": round(elapsed, 3),
+        "cues_per_second": round(cues / elapsed, 1),
+        "requests": len(recorder.latencies),
+        "request_errors": recorder.errors,
+        "untranslated": len(job.untranslated),
+        "latency_p50": round(statistics.median(latencies), 4),
+        "latency_p95": round(percentile(latencies, 0.95), 4),
+        "latency_p99": round(percentile(latencies, 0.99), 4),
+        "load_cpu_seconds": round(job.load_cpu, 4),
+        "save_cpu_seconds": round(job.save_cpu, 4),
+        "peak_rss_mb": peak_rss_mb,
+        "error": str(job.error) if job.error else None,
+    })
+
+
+def compare(previous, current):
+    """列出每種句數的 cues_per_second 與 latency_p95 相對先前結果的變化"""
+    before = {result["cues"]: result for result in previous["results"]}
+    lines = [f"與 {previous.get('revision') or '先前結果'} 比較："]
+    for result in current["results"]:
+        old = before.get(result["cues"])
+        if old is None:
+            continue
+        speed = result["cues_per_second"] / old["cues_per_second"] - 1 if old["cues_per_second"] else 0.0
+        lines.append(f"  {result['cues']:>6} 句  cues/s {old['cues_per_second']:>8} -> {result['cues_per_second']:>8} ({speed:+.1%})"
+                     f"  p95 {old['latency_p95']} -> {result['latency_p95']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.throughput", description="端對端字幕翻譯吞吐量測試")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="合成字幕檔的句數")
+    parser.add_argument("--parallel", type=int, default=8, help="全域並行請求數")
+    parser.add_argument("--batch-size", type=int, default=1, help="每個請求合併翻譯的字幕句數")
+    parser.add_argument("--policy", default="fifo", choices=list(POLICY_NAMES.values()), help="排程策略")
+    parser.add_argument("--backend", default="openai", choices=list(BACKENDS), help="翻譯請求使用的 API")
+    parser.add_argument("--no-stream", action="store_true", help="等待完整回應，不以串流接收譯文")
+    parser.add_argument("--no-dedupe", action="store_true", help="不合併重複的字幕")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="合成字幕中重複內容的比例")
+    parser.add_argument("--seed", type=int, default=0, help="合成字幕的亂數種子")
+    parser.add_argument("--latency", type=float, default=0.005, help="替身伺服器每個請求開始輸出前的等待秒數")
+    parser.add_argument("--tokens-per-second", type=float, default=5000, help="替身伺服器每個請求每秒輸出的字數")
+    parser.add_argument("--mock-parallel", type=int, default=8, help="替身伺服器同時處理的請求數")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="替身伺服器回傳錯誤的比例")
+    parser.add_argument("--output", default="benchmark.json", help="結果 JSON 檔")
+    parser.add_argument("--compare", help="要比較的先前結果 JSON 檔")
+    args = parser.parse_args(argv)
+
+    server = MockOllamaServer(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                              parallel=args.mock_parallel, error_rate=args.error_rate, seed=args.seed).start()
+    context = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        for cues in args.sizes:
+            queue = context.Queue()
+            process = context.Process(target=run_size, args=(cues, args, server.url, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            results.append(result)
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+    finally:
+        server.stop()
+
+    settings = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    report = {
+        "revision": git_revision(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": settings,
+        "results": results,
+    }
+    with open(args.output, "w", encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果已寫入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print(compare(json.load(f), report))
+
+
+if __name__ == "__main__":
+    main()
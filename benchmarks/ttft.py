@@ -0,0 +1,104 @@
+"""比較共用 prompt 前綴與否的首個 token 延遲（time to first token）
+
+    python -m benchmarks.ttft --model aya-expanse --requests 30 字幕.srt
+
+shared 模式使用 prompts.prompt_layout() 的版面，每個請求開頭的系統提示與翻譯指示
+都逐位元組相同；unique 模式在系統提示最前面加上每個請求都不同的編號，
+模擬前綴無法沿用 KV cache 的情況。兩種模式依序各跑一輪（交錯執行會互相洗掉 cache），
+每輪先送一個暖機請求讓模型載入，不列入統計。
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from benchmarks.common import percentile
+from srt_translator.ollama_client import DEFAULT_BASE_URL, AsyncOllamaClient
+from srt_translator.prompts import SYSTEM_PROMPTS, prompt_layout
+from srt_translator.srt_io import read_cues
+
+SAMPLE_TEXTS = [
+    "おはようございます",
+    "今日はどこに行くの？",
+    "ちょっと待って…",
+    "本当にそう思ってるの？",
+    "ありがとう、助かった",
+    "もう一回言ってください",
+    "大丈夫、心配しないで",
+    "それは違うと思う",
+]
+
+
+async def measure(client, model, layout, texts, unique_prefix):
+    """依序送出每句字幕，回傳 [(首個 token 秒數, 完整回應秒數)]"""
+    timings = []
+    for number, text in enumerate(texts):
+        messages = layout.messages(layout.single(text))
+        if unique_prefix:
+            system = messages[0]
+            messages[0] = {"role": system["role"], "content": f"[{number}-{time.time_ns()}]\n{system['content']}"}
+        payload = {"model": model, "messages": messages, "temperature": 0.1}
+
+        first_token = []
+        started = time.monotonic()
+
+        def on_delta(content):
+            if not first_token:
+                first_token.append(time.monotonic() - started)
+
+        await client.stream_chat_completion(payload, on_delta)
+        timings.append((first_token[0] if first_token else time.monotonic() - started, time.monotonic() - started))
+    return timings[1:]  # 第一個請求用來暖機
+
+
+def summarize(timings):
+    ttft = [first for first, _ in timings]
+    total = [whole for _, whole in timings]
+    return {
+        "requests": len(timings),
+        "ttft_p50": round(statistics.median(ttft), 4),
+        "ttft_p95": round(percentile(ttft, 0.95), 4),
+        "ttft_mean": round(statistics.mean(ttft), 4),
+        "total_mean": round(statistics.mean(total), 4),
+    }
+
+
+async def run(args, texts):
+    client = AsyncOllamaClient(args.url, pool_size=1, timeout=args.timeout)
+    layout = prompt_layout(SYSTEM_PROMPTS[args.prompt], args.target_lang)
+    results = {}
+    for mode in args.modes:
+        timings = await measure(client, args.model, layout, texts, unique_prefix=mode == "unique")
+        results[mode] = summarize(timings)
+    await client.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ttft", description="共用 prompt 前綴的首個 token 延遲測試")
+    parser.add_argument("srt", nargs="?", help="取用字幕內容的 SRT 檔，未指定時使用內建的例句")
+    parser.add_argument("--model", required=True, help="Ollama 模型名稱")
+    parser.add_argument("--url", default=DEFAULT_BASE_URL, help="Ollama 服務位址")
+    parser.add_argument("--prompt", default="adult", choices=list(SYSTEM_PROMPTS), help="系統提示")
+    parser.add_argument("--target-lang", default="繁體中文", help="目標語言")
+    parser.add_argument("--requests", type=int, default=30, help="每種模式送出的請求數")
+    parser.add_argument("--modes", nargs="+", default=["shared", "unique"], choices=["shared", "unique"], help="要測試的模式")
+    parser.add_argument("--timeout", type=float, default=300, help="單一請求逾時秒數")
+    args = parser.parse_args(argv)
+
+    if args.srt:
+        _, texts, _ = read_cues(args.srt)
+        texts = [text for text in texts if text.strip()]
+    else:
+        texts = SAMPLE_TEXTS
+    # 多一句作為暖機請求
+    texts = [texts[i % len(texts)] for i in range(args.requests + 1)]
+
+    results = asyncio.run(run(args, texts))
+    print(json.dumps({"model": args.model, "prompt": args.prompt, "results": results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,12 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, Menu
 import os
 import sys
-import pysrt
-import json
-import urllib.request
-import asyncio
-import threading
+
+from srt_translator import AUTO_CONCURRENCY, POLICY_NAMES, TranslationEngine
+from srt_translator.engine import DEFAULT_PROCESSES
+from srt_translator.model_list import load_cached_models, refresh_models
+from srt_translator.srt_io import parse_time_range
+from srt_translator.ui_events import UI_REFRESH_MS
 
 # 嘗試導入 tkinterdnd2，如果失敗則使用基本的 tkinter
 try:
@@ -16,141 +17,19 @@ except ImportError:
     TKDND_AVAILABLE = False
     print("警告：未安裝 tkinterdnd2 模組，拖放功能將被停用")
 
-# 設置 Ollama 並行請求數
-os.environ['OLLAMA_NUM_PARALLEL'] = '8'  # 設置為8個並行請求
-
-class TranslationThread(threading.Thread):
-    def __init__(self, file_path, source_lang, target_lang, model_name, parallel_requests, progress_callback, complete_callback):
-        threading.Thread.__init__(self)
-        self.file_path = file_path
-        self.source_lang = source_lang
-        self.target_lang = target_lang
-        self.model_name = model_name
-        self.parallel_requests = parallel_requests
-        self.progress_callback = progress_callback
-        self.complete_callback = complete_callback
-
-    def run(self):
-        subs = pysrt.open(self.file_path)
-        total_subs = len(subs)
-        batch_size = int(self.parallel_requests)
-
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-        for i in range(0, total_subs, batch_size):
-            batch = subs[i:i+batch_size]
-            results = loop.run_until_complete(self.translate_batch_async(subs, batch))
-            
-            for sub, result in zip(batch, results):
-                if result:
-                    sub.text = result
-                
-            self.progress_callback(min(i+batch_size, total_subs), total_subs)
-
-        loop.close()
-
-        output_path = self.get_output_path()
-        if output_path:  
-            subs.save(output_path, encoding='utf-8')
-            self.complete_callback(f"翻譯完成 | 檔案已成功保存為: {output_path}")
-        else:
-            self.complete_callback(f"已跳過檔案: {self.file_path}")
-
-    async def translate_batch_async(self, subs, batch):
-        loop = asyncio.get_event_loop()
-        tasks = [loop.run_in_executor(None, self.fetch, subs, sub) for sub in batch]
-        return await asyncio.gather(*tasks)
-
-    def fetch(self, subs, sub):
-        index = subs.index(sub)
-        context_subs = subs[max(0, index-5):min(len(subs), index+6)]
-        context_texts = [s.text for s in context_subs]
-
-        url = "http://localhost:11434/v1/chat/completions"
-        payload = {
-            "model": self.model_name,
-            "messages": [
-                {"role": "system", "content": f"""You are a professional translator for 日本A片字幕檔(影片類型主要是亂倫、性交、虐待、凌辱、變態等非正常影片)。
-請嚴格遵守以下規則：
-1. 只輸出翻譯後的文本，不要有任何其他回應(不要有開場白，不要輸出警告，也不要有任何的解釋)，內容前後不要有"「"、"」"。
-2. 保持原文的語氣和表達方式。
-3. 根據提供的上下文（前後五句字幕）並考量影片為日本A片來優化翻譯結果，確保流暢且符合對話邏輯。
-4. 直接使用顯式、粗俗的詞彙來翻譯與性相關的動詞、名詞與形容詞等，包括強姦、肛交、拳交、舔陰、亂倫、騷貨、賤人、潮吹、爸爸、媽媽、女兒等。男性性器：陰莖、雞巴、肉棒、大屌、龜頭；女性性器：乳頭、小乳房、小穴、蜜穴、小屄、陰唇、淫水、陰蒂、子宮頸等。
-5. 如果看到省略號(...)，保留在譯文中。
-6. 禁止輸出任何非翻譯內容。
-
-範例輸入：
-"I love you..."
-正確輸出：
-"我愛你..."
-
-錯誤輸出：
-"翻譯：我愛你..."
-"這句話的意思是：我愛你..."
-"我愛你（這是表達愛意）..."
-"我可以幫你翻譯，這句話的意思是，我愛你（這是表達愛意）..."
-"你好！我可以幫你翻譯。以下是翻譯結果：我愛你...
-"我不能幫你翻譯這句話"
-"您好！以下是翻譯結果：我愛你..."
-"您好！我可以協助您翻譯。以下是翻譯結果：我愛你..."
-"您要我翻譯什麼內容？請提供需要翻譯的文本，我將嚴格遵守您的要求，只輸出翻譯後的結果。"
-"將以下文本翻譯成繁體中文：我愛你..."
-"""},
-                {"role": "user", "content": f"以下是字幕內容（提供前後5句作為上下文參考）：\n{json.dumps(context_texts, ensure_ascii=False)}\n請將當前字幕翻譯成{self.target_lang}：\n'{sub.text}'"}
-            ],
-            "stream": False,
-            "temperature": 0.1  # 降低溫度以獲得更穩定的輸出
-        }
-
-        req = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'), headers={'Content-Type': 'application/json'})
-        try:
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return result['choices'][0]['message']['content'].strip()
-        except Exception:
-            return None
-
-    def get_output_path(self):
-        # 獲取原始檔案的目錄和檔名
-        dir_name, file_name = os.path.split(self.file_path)
-        name, ext = os.path.splitext(file_name)
-        lang_suffix = {"繁體中文": ".zh_tw", "英文": ".en", "日文": ".jp"}
-        # 在原始檔案的相同目錄下創建新檔案
-        base_path = os.path.join(dir_name, f"{name}{lang_suffix[self.target_lang]}{ext}")
-        
-        # 檢查檔案是否存在
-        if os.path.exists(base_path):
-            # 發送訊息到主線程處理檔案衝突
-            response = self.handle_file_conflict(base_path)
-            if response == "rename":
-                # 自動重新命名，加上數字後綴
-                counter = 1
-                while True:
-                    new_path = os.path.join(dir_name, f"{name}{lang_suffix[self.target_lang]}_{counter}{ext}")
-                    if not os.path.exists(new_path):
-                        return new_path
-                    counter += 1
-            elif response == "skip":
-                return None
-            # response == "overwrite" 則使用原始路徑
-        
-        return base_path
-
-    def handle_file_conflict(self, file_path):
-        # 使用 Queue 在線程間通信
-        queue = Queue()
-        # 請求主線程顯示對話框
-        self.progress_callback(-1, -1, {"type": "file_conflict", "path": file_path, "queue": queue})
-        # 等待使用者回應
-        return queue.get()
-
 class App(TkinterDnD.Tk if TKDND_AVAILABLE else tk.Tk):
     def __init__(self):
         super().__init__()
 
         self.title("SRT 字幕翻譯器")
-        self.geometry("600x500")
+        self.geometry("600x650")
+
+        # 所有檔案共用同一個翻譯核心（連線池、排程器、翻譯記憶與量測紀錄）；
+        # 翻譯工作與排程器在其他執行緒中執行，進度一律經由事件佇列交給介面執行緒
+        self.engine = TranslationEngine.with_defaults()
+        self.ui_events = self.engine.events
+        self.file_rows = {}  # 檔案路徑 -> 進度表中的列
+        self.jobs = {}  # 檔案路徑 -> 最近一次加入排程的翻譯工作
 
         # 只在有 tkinterdnd2 時啟用拖放功能
         if TKDND_AVAILABLE:
@@ -158,6 +37,8 @@ class App(TkinterDnD.Tk if TKDND_AVAILABLE else tk.Tk):
             self.dnd_bind('<<Drop>>', self.handle_drop)
 
         self.create_widgets()
+        self.after(UI_REFRESH_MS, self.process_ui_events)
+        self.refresh_model_list()
 
     def handle_drop(self, event):
         """處理檔案拖放"""
@@ -187,6 +68,7 @@ class App(TkinterDnD.Tk if TKDND_AVAILABLE else tk.Tk):
         
         # 創建右鍵選單
         self.context_menu = Menu(self, tearoff=0)
+        self.context_menu.add_command(label="預覽翻譯", command=self.preview_selected)
         self.context_menu.add_command(label="移除", command=self.remove_selected)
         
         # 用於追踪拖曳
@@ -211,23 +93,79 @@ class App(TkinterDnD.Tk if TKDND_AVAILABLE else tk.Tk):
         model_frame.pack(pady=10)
 
         ttk.Label(model_frame, text="選擇模型:").grid(row=0, column=0)
-        self.model_combo = ttk.Combobox(model_frame, values=self.get_model_list())
+        # 先列出上次取得的模型，視窗出現後再於背景向 Ollama 查詢
+        self.model_combo = ttk.Combobox(model_frame, values=load_cached_models())
         self.model_combo.set("huihui_ai/aya-expanse-abliterated:latest")
         self.model_combo.grid(row=0, column=1)
 
         ttk.Label(model_frame, text="並行請求數:").grid(row=0, column=2)
-        self.parallel_requests = ttk.Combobox(model_frame, values=["1", "2", "3", "4", "5", "6", "7", "8"])
-        self.parallel_requests.set("6")
+        # 選項上限為連線池大小（環境變數 OLLAMA_NUM_PARALLEL，預設 8）
+        self.parallel_requests = ttk.Combobox(model_frame, values=[str(n) for n in range(1, self.engine.pool_size + 1)] + [AUTO_CONCURRENCY])
+        self.parallel_requests.set(str(min(6, self.engine.pool_size)))
         self.parallel_requests.grid(row=0, column=3)
 
-        # 翻譯按鈕
-        self.translate_button = ttk.Button(self, text="開始翻譯", command=self.start_translation)
-        self.translate_button.pack(pady=10)
+        ttk.Label(model_frame, text="排程策略:").grid(row=1, column=0)
+        self.scheduling_policy = ttk.Combobox(model_frame, values=list(POLICY_NAMES))
+        self.scheduling_policy.set("先進先出")
+        self.scheduling_policy.grid(row=1, column=1)
+
+        # 每個請求合併翻譯的字幕句數，1 表示逐句翻譯
+        ttk.Label(model_frame, text="每批字幕數:").grid(row=1, column=2)
+        self.batch_size = ttk.Combobox(model_frame, values=["1", "2", "4", "8", "16"])
+        self.batch_size.set("1")
+        self.batch_size.grid(row=1, column=3)
+
+        # 合併重複字幕時，只有內容與前後文都相同的字幕才會共用譯文
+        self.dedupe = tk.BooleanVar(value=True)
+        ttk.Checkbutton(model_frame, text="合併重複字幕", variable=self.dedupe).grid(row=2, column=0, columnspan=2)
+
+        ttk.Label(model_frame, text="上下文句數:").grid(row=2, column=2)
+        self.context_radius = ttk.Combobox(model_frame, values=["0", "1", "2", "3", "5", "8", "10"])
+        self.context_radius.set("5")
+        self.context_radius.grid(row=2, column=3)
+
+        # 串流接收譯文，模型一開始輸出開場白或拒絕翻譯就中止重來
+        self.stream_output = tk.BooleanVar(value=True)
+        ttk.Checkbutton(model_frame, text="串流輸出", variable=self.stream_output).grid(row=3, column=0, columnspan=2)
+
+        # 大量檔案時把字幕檔的解析與寫出交給子行程，介面與排程器不必等待
+        self.use_processes = tk.BooleanVar(value=False)
+        ttk.Checkbutton(model_frame, text="多行程讀寫檔案", variable=self.use_processes).grid(row=3, column=2, columnspan=2)
+
+        # 翻譯與取消按鈕
+        button_frame = ttk.Frame(self)
+        button_frame.pack(pady=10)
+        self.translate_button = ttk.Button(button_frame, text="開始翻譯", command=self.start_translation)
+        self.translate_button.pack(side=tk.LEFT, padx=5)
+        # 取消所有未完成的檔案，已翻譯的字幕保留在進度日誌中，下次從中斷處接續
+        self.cancel_button = ttk.Button(button_frame, text="取消翻譯", command=self.cancel_translation)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+        # 預覽：選取的檔案優先於其他檔案翻譯，並先翻譯預覽範圍內的字幕
+        ttk.Label(button_frame, text="預覽範圍:").pack(side=tk.LEFT, padx=(15, 2))
+        self.preview_range = ttk.Entry(button_frame, width=12)
+        self.preview_range.insert(0, "00:00-05:00")
+        self.preview_range.pack(side=tk.LEFT)
+        self.preview_button = ttk.Button(button_frame, text="預覽選取的檔案", command=self.preview_selected)
+        self.preview_button.pack(side=tk.LEFT, padx=5)
 
         # 進度條
         self.progress_bar = ttk.Progressbar(self, length=400, mode='determinate')
         self.progress_bar.pack(pady=10)
 
+        # 目前的並行請求數，自動調整時會隨 Ollama 的表現變動
+        self.concurrency_label = ttk.Label(self, text="")
+        self.concurrency_label.pack()
+
+        # 各檔案的翻譯進度
+        self.file_progress = ttk.Treeview(self, columns=("progress", "status"), height=5)
+        self.file_progress.heading("#0", text="檔案")
+        self.file_progress.heading("progress", text="進度")
+        self.file_progress.heading("status", text="狀態")
+        self.file_progress.column("#0", width=180)
+        self.file_progress.column("progress", width=110, anchor="center")
+        self.file_progress.column("status", width=280)
+        self.file_progress.pack(pady=5, padx=10, fill=tk.X)
+
         # 狀態標籤
         self.status_label = ttk.Label(self, text="", wraplength=550, justify="center")
         self.status_label.pack(pady=10, fill=tk.X, expand=True)
@@ -237,64 +175,139 @@ class App(TkinterDnD.Tk if TKDND_AVAILABLE else tk.Tk):
         for file in files:
             self.file_list.insert(tk.END, file)
 
-    def get_model_list(self):
-        url = "http://localhost:11434/v1/models"
-        try:
-            with urllib.request.urlopen(url) as response:
-                models = json.loads(response.read())
-                if 'data' in models and isinstance(models['data'], list):
-                    return [model['id'] for model in models['data']]
-        except Exception:
-            pass
-        return []
+    def refresh_model_list(self):
+        """在背景查詢 Ollama 的模型列表，結果經由事件佇列交給介面執行緒"""
+        refresh_models(lambda models, error: self.ui_events.post({"type": "models", "models": models, "error": error}))
+
+    def update_model_list(self, models, error):
+        if error is not None:
+            # 保留上次的模型列表，翻譯時 Ollama 若已啟動仍可使用
+            self.status_label.config(text=f"無法取得模型列表，請確認 Ollama 是否已啟動 ({error})")
+            return
+        self.model_combo['values'] = models
 
     def start_translation(self):
         self.progress_bar['value'] = 0
         self.status_label.config(text="")
+        self.configure_engine()
+
         for i in range(self.file_list.size()):
             file_path = self.file_list.get(i)
-            thread = TranslationThread(
-                file_path, 
-                self.source_lang.get(), 
-                self.target_lang.get(), 
-                self.model_combo.get(),
-                self.parallel_requests.get(),
-                self.update_progress,
-                self.file_translated
-            )
-            thread.start()
+            self.add_file_row(file_path)
+            # 同一個檔案已在排程中時先取消，新的工作從進度日誌接續
+            self.jobs[file_path] = self.engine.submit(self.create_job(file_path), self.jobs.get(file_path))
 
         self.status_label.config(text=f"正在翻譯 {self.file_list.size()} 個檔案...")
 
-    def update_progress(self, current, total, extra_data=None):
-        if extra_data and extra_data.get("type") == "file_conflict":
-            # 在主線程中顯示對話框
-            response = messagebox.askyesnocancel(
-                "檔案已存在",
-                f"檔案 {extra_data['path']} 已存在。\n是否覆蓋？\n'是' = 覆蓋\n'否' = 重新命名\n'取消' = 跳過",
-                icon="warning"
-            )
-            
-            # 轉換回應為字符串
-            if response is True:
-                result = "overwrite"
-            elif response is False:
-                result = "rename"
-            else:  # response is None
-                result = "skip"
-            
-            # 將結果發送回翻譯線程
-            extra_data["queue"].put(result)
+    def preview_selected(self):
+        """選取的檔案以預覽優先度翻譯，預覽範圍內的字幕最先完成"""
+        selected = self.file_list.curselection()
+        if not selected:
+            messagebox.showinfo("提示", "請先在清單中選取要預覽的檔案")
+            return
+        try:
+            window = parse_time_range(self.preview_range.get())
+        except ValueError as e:
+            messagebox.showerror("錯誤", str(e))
+            return
+        file_path = self.file_list.get(selected[0])
+        self.configure_engine()
+        self.add_file_row(file_path)
+        # 同一個檔案已在排程中時先取消，新的工作從進度日誌接續
+        self.jobs[file_path] = self.engine.preview(self.create_job(file_path), window, self.jobs.get(file_path))
+        current_text = self.status_label.cget("text")
+        self.status_label.config(text=f"{current_text}\n正在預覽 {os.path.basename(file_path)} ({self.preview_range.get()})...")
+
+    def configure_engine(self):
+        processes = DEFAULT_PROCESSES if self.use_processes.get() else 0
+        self.engine.configure(self.parallel_requests.get(), POLICY_NAMES[self.scheduling_policy.get()], processes)
+
+    def create_job(self, file_path):
+        return self.engine.create_job(
+            file_path,
+            self.source_lang.get(),
+            self.target_lang.get(),
+            self.model_combo.get(),
+            self.batch_size.get(),
+            "adult_context",
+            int(self.context_radius.get()),
+            dedupe=self.dedupe.get(),
+            stream=self.stream_output.get()
+        )
+
+    def cancel_translation(self):
+        self.engine.cancel()
+        current_text = self.status_label.cget("text")
+        self.status_label.config(text=f"{current_text}\n正在取消翻譯...")
+
+    def add_file_row(self, file_path):
+        """在進度表中加入（或重設）一個檔案"""
+        row = self.file_rows.get(file_path)
+        if row is None:
+            row = self.file_progress.insert("", tk.END, text=os.path.basename(file_path))
+            self.file_rows[file_path] = row
+        self.file_progress.item(row, values=("", "等待中"))
+
+    def process_ui_events(self):
+        """在介面執行緒中套用工作執行緒送來的更新，每個間隔只重畫一次"""
+        try:
+            updates = self.ui_events.drain()
+            for file_path, (current, total) in updates.progress.items():
+                self.update_progress(file_path, current, total, updates.partial.get(file_path))
+            if updates.overall is not None:
+                self.update_overall_progress(*updates.overall)
+            for event in updates.events:
+                if event["type"] == "file_conflict":
+                    self.ask_file_conflict(event)
+                elif event["type"] == "models":
+                    self.update_model_list(event["models"], event["error"])
+                else:
+                    self.file_translated(event["path"], event["message"])
+        finally:
+            self.after(UI_REFRESH_MS, self.process_ui_events)
+
+    def ask_file_conflict(self, extra_data):
+        # 在主線程中顯示對話框
+        response = messagebox.askyesnocancel(
+            "檔案已存在",
+            f"檔案 {extra_data['path']} 已存在。\n是否覆蓋？\n'是' = 覆蓋\n'否' = 重新命名\n'取消' = 跳過",
+            icon="warning"
+        )
+        
+        # 轉換回應為字符串
+        if response is True:
+            result = "overwrite"
+        elif response is False:
+            result = "rename"
+        else:  # response is None
+            result = "skip"
+        
+        # 將結果發送回翻譯線程
+        extra_data["queue"].put(result)
+
+    def update_progress(self, file_path, current, total, partial=None):
+        """更新單一檔案在進度表中的列"""
+        row = self.file_rows.get(file_path)
+        if row is None or total <= 0:
             return
-            
-        # 正常的進度更新
-        if current >= 0 and total >= 0:
-            percentage = int(current / total * 100)
-            self.progress_bar['value'] = percentage
-            self.status_label.config(text=f"正在翻譯第 {current}/{total} 句字幕 ({percentage}%)")
-            self.update_idletasks()
-
-    def file_translated(self, message):
+        status = "翻譯中"
+        if partial:
+            # 串流中的譯文，讓使用者看到模型正在輸出
+            status = " ".join(partial.split())[-40:]
+        self.file_progress.item(row, values=(f"{current}/{total} ({int(current / total * 100)}%)", status))
+
+    def update_overall_progress(self, done, total):
+        """更新所有檔案的整體進度"""
+        if total > 0:
+            self.progress_bar['value'] = int(done / total * 100)
+            mode = "（自動調整）" if self.engine.concurrency is not None else ""
+            self.concurrency_label.config(text=f"目前並行請求數: {self.engine.limit}{mode}")
+
+    def file_translated(self, file_path, message):
+        row = self.file_rows.get(file_path)
+        if row is not None:
+            # 訊息開頭為結果（翻譯完成、已跳過檔案、無法讀取檔案…），完整訊息顯示在狀態標籤
+            self.file_progress.set(row, "status", message.split(" | ")[0].split(":")[0])
         current_text = self.status_label.cget("text")
         self.status_label.config(text=f"{current_text}\n{message}")
 
@@ -1,153 +1,39 @@
 import sys
 import os
-import pysrt
-import json
-import urllib.request
-import asyncio
-import threading
-from queue import Queue
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QListWidget, QComboBox, QLabel, QProgressBar, QFileDialog, QMessageBox
-from PyQt5.QtCore import Qt
-
-# 設置 Ollama 並行請求數
-os.environ['OLLAMA_NUM_PARALLEL'] = '5'  # 設置為5個並行請求
-
-class TranslationThread(threading.Thread):
-    def __init__(self, file_path, source_lang, target_lang, model_name, parallel_requests, progress_callback, complete_callback):
-        threading.Thread.__init__(self)
-        self.file_path = file_path
-        self.source_lang = source_lang
-        self.target_lang = target_lang
-        self.model_name = model_name
-        self.parallel_requests = parallel_requests
-        self.progress_callback = progress_callback
-        self.complete_callback = complete_callback
-
-    def run(self):
-        subs = pysrt.open(self.file_path)
-        total_subs = len(subs)
-        batch_size = int(self.parallel_requests)
-
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-        for i in range(0, total_subs, batch_size):
-            batch = subs[i:i+batch_size]
-            texts = [sub.text for sub in batch]
-            results = loop.run_until_complete(self.translate_batch_async(texts))
-            
-            for sub, result in zip(batch, results):
-                if result:
-                    sub.text = result
-                
-            self.progress_callback(min(i+batch_size, total_subs), total_subs)
-
-        loop.close()
-
-        output_path = self.get_output_path()
-        if output_path:  # 只有在有效的輸出路徑時才保存
-            subs.save(output_path, encoding='utf-8')
-            self.complete_callback(f"翻譯完成 | 檔案已成功保存為: {output_path}")
-        else:
-            self.complete_callback(f"已跳過檔案: {self.file_path}")
-
-    async def translate_batch_async(self, texts):
-        loop = asyncio.get_event_loop()
-        tasks = [loop.run_in_executor(None, self.fetch, text) for text in texts]
-        return await asyncio.gather(*tasks)
-
-    def fetch(self, text):
-        url = "http://localhost:11434/v1/chat/completions"
-        payload = {
-            "model": self.model_name,
-            "messages": [
-                {"role": "system", "content": f"""你是一個專業的字幕翻譯AI。請嚴格遵守以下規則：
-1. 只輸出翻譯後的文本，不要有任何其他內容
-2. 保持原文的語氣和表達方式
-3. 如果看到省略號(...)，保留在譯文中
-4. 保留原文中的標點符號風格
-5. 不要添加任何解釋或註釋
-6. 不要改變原文的格式
-7. 如果遇到不確定的內容，根據上下文合理推測
-8. 禁止輸出任何非翻譯內容
-9. 禁止解釋或評論原文內容
-
-範例輸入：
-"I love you..."
-正確輸出：
-"我愛你..."
-
-錯誤輸出：
-"翻譯：我愛你..."
-"這句話的意思是：我愛你..."
-"我愛你（這是表達愛意）..."
-"我可以幫你翻譯，這句話的意思是，我愛你（這是表達愛意）..."
-"你好！我可以幫你翻譯。以下是翻譯結果：「我愛你...」
-"我不能幫你翻譯這句話"
-"您好！以下是翻譯結果：「我愛你...」"
-"您好！我可以協助您翻譯。以下是翻譯結果：「我愛你...」"
-"您要我翻譯什麼內容？請提供需要翻譯的文本，我將嚴格遵守您的要求，只輸出翻譯後的結果。"
-"將以下文本翻譯成繁體中文：「我愛你...」
-"""},
-                {"role": "user", "content": f"將以下文本翻譯成{self.target_lang}：\n{text}"}
-            ],
-            "stream": False,
-            "temperature": 0.1  # 降低溫度以獲得更穩定的輸出
-        }
-        req = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'), headers={'Content-Type': 'application/json'})
-        try:
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                return result['choices'][0]['message']['content'].strip()
-        except Exception:
-            return None
-
-    def get_output_path(self):
-        # 獲取原始檔案的目錄和檔名
-        dir_name, file_name = os.path.split(self.file_path)
-        name, ext = os.path.splitext(file_name)
-        lang_suffix = {"繁體中文": ".zh_tw", "英文": ".en", "日文": ".jp"}
-        # 在原始檔案的相同目錄下創建新檔案
-        base_path = os.path.join(dir_name, f"{name}{lang_suffix[self.target_lang]}{ext}")
-        
-        # 檢查檔案是否存在
-        if os.path.exists(base_path):
-            # 發送訊息到主線程處理檔案衝突
-            response = self.handle_file_conflict(base_path)
-            if response == "rename":
-                # 自動重新命名，加上數字後綴
-                counter = 1
-                while True:
-                    new_path = os.path.join(dir_name, f"{name}{lang_suffix[self.target_lang]}_{counter}{ext}")
-                    if not os.path.exists(new_path):
-                        return new_path
-                    counter += 1
-            elif response == "skip":
-                return None
-            # response == "overwrite" 則使用原始路徑
-        
-        return base_path
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QListWidget, QComboBox, QCheckBox, QLabel, QLineEdit, QProgressBar, QFileDialog, QMessageBox, QTreeWidget, QTreeWidgetItem
+from PyQt5.QtCore import Qt, QTimer
 
-    def handle_file_conflict(self, file_path):
-        # 使用 Queue 在線程間通信
-        queue = Queue()
-        # 請求主線程顯示對話框
-        self.progress_callback(-1, -1, {"type": "file_conflict", "path": file_path, "queue": queue})
-        # 等待使用者回應
-        return queue.get()
+from srt_translator import AUTO_CONCURRENCY, POLICY_NAMES, TranslationEngine
+from srt_translator.engine import DEFAULT_PROCESSES
+from srt_translator.model_list import load_cached_models, refresh_models
+from srt_translator.srt_io import parse_time_range
+from srt_translator.ui_events import UI_REFRESH_MS
 
 class App(QWidget):
     def __init__(self):
         super().__init__()
 
         self.setWindowTitle("SRT 字幕翻譯器")
-        self.setGeometry(100, 100, 600, 500)
+        self.setGeometry(100, 100, 600, 650)
+
+        # 所有檔案共用同一個翻譯核心（連線池、排程器、翻譯記憶與量測紀錄）；
+        # 翻譯工作與排程器在其他執行緒中執行，進度一律經由事件佇列交給介面執行緒
+        self.engine = TranslationEngine.with_defaults()
+        self.ui_events = self.engine.events
+        self.file_rows = {}  # 檔案路徑 -> 進度表中的列
+        self.jobs = {}  # 檔案路徑 -> 最近一次加入排程的翻譯工作
 
         self.layout = QVBoxLayout()
         self.setLayout(self.layout)
 
         self.create_widgets()
 
+        self.ui_timer = QTimer(self)
+        self.ui_timer.setInterval(UI_REFRESH_MS)
+        self.ui_timer.timeout.connect(self.process_ui_events)
+        self.ui_timer.start()
+        self.refresh_model_list()
+
     def create_widgets(self):
         # 檔案選擇按鈕
         self.file_button = QPushButton("選擇 SRT 檔案")
@@ -177,26 +63,78 @@ class App(QWidget):
         self.model_label = QLabel("選擇模型:")
         self.layout.addWidget(self.model_label)
         self.model_combo = QComboBox()
-        self.model_combo.addItems(self.get_model_list())
+        # 先列出上次取得的模型，視窗出現後再於背景向 Ollama 查詢
+        self.model_combo.addItems(load_cached_models())
         self.model_combo.setCurrentText("huihui_ai/aya-expanse-abliterated:latest")
         self.layout.addWidget(self.model_combo)
 
         self.parallel_requests_label = QLabel("並行請求數:")
         self.layout.addWidget(self.parallel_requests_label)
         self.parallel_requests = QComboBox()
-        self.parallel_requests.addItems(["1", "2", "3", "4", "5"])
-        self.parallel_requests.setCurrentText("5")
+        # 選項上限為連線池大小（環境變數 OLLAMA_NUM_PARALLEL，預設 8）
+        self.parallel_requests.addItems([str(n) for n in range(1, self.engine.pool_size + 1)] + [AUTO_CONCURRENCY])
+        self.parallel_requests.setCurrentText(str(min(5, self.engine.pool_size)))
         self.layout.addWidget(self.parallel_requests)
 
+        # 每個請求合併翻譯的字幕句數，1 表示逐句翻譯
+        self.batch_size_label = QLabel("每批字幕數:")
+        self.layout.addWidget(self.batch_size_label)
+        self.batch_size = QComboBox()
+        self.batch_size.addItems(["1", "2", "4", "8", "16"])
+        self.batch_size.setCurrentText("1")
+        self.layout.addWidget(self.batch_size)
+
+        self.scheduling_policy_label = QLabel("排程策略:")
+        self.layout.addWidget(self.scheduling_policy_label)
+        self.scheduling_policy = QComboBox()
+        self.scheduling_policy.addItems(list(POLICY_NAMES))
+        self.scheduling_policy.setCurrentText("先進先出")
+        self.layout.addWidget(self.scheduling_policy)
+
+        # 串流接收譯文，模型一開始輸出開場白或拒絕翻譯就中止重來
+        self.stream_output = QCheckBox("串流輸出")
+        self.stream_output.setChecked(True)
+        self.layout.addWidget(self.stream_output)
+
+        # 大量檔案時把字幕檔的解析與寫出交給子行程，介面與排程器不必等待
+        self.use_processes = QCheckBox("多行程讀寫檔案")
+        self.layout.addWidget(self.use_processes)
+
         # 翻譯按鈕
         self.translate_button = QPushButton("開始翻譯")
         self.translate_button.clicked.connect(self.start_translation)
         self.layout.addWidget(self.translate_button)
 
+        # 取消所有未完成的檔案，已翻譯的字幕保留在進度日誌中，下次從中斷處接續
+        self.cancel_button = QPushButton("取消翻譯")
+        self.cancel_button.clicked.connect(self.cancel_translation)
+        self.layout.addWidget(self.cancel_button)
+
+        # 預覽：選取的檔案優先於其他檔案翻譯，並先翻譯預覽範圍內的字幕
+        self.preview_range_label = QLabel("預覽範圍:")
+        self.layout.addWidget(self.preview_range_label)
+        self.preview_range = QLineEdit("00:00-05:00")
+        self.layout.addWidget(self.preview_range)
+        self.preview_button = QPushButton("預覽選取的檔案")
+        self.preview_button.clicked.connect(self.preview_selected)
+        self.layout.addWidget(self.preview_button)
+
         # 進度條
         self.progress_bar = QProgressBar()
         self.layout.addWidget(self.progress_bar)
 
+        # 目前的並行請求數，自動調整時會隨 Ollama 的表現變動
+        self.concurrency_label = QLabel("")
+        self.layout.addWidget(self.concurrency_label)
+
+        # 各檔案的翻譯進度
+        self.file_progress = QTreeWidget()
+        self.file_progress.setHeaderLabels(["檔案", "進度", "狀態"])
+        self.file_progress.setRootIsDecorated(False)
+        self.file_progress.setColumnWidth(0, 180)
+        self.file_progress.setColumnWidth(1, 150)
+        self.layout.addWidget(self.file_progress)
+
         # 狀態標籤
         self.status_label = QLabel("")
         self.layout.addWidget(self.status_label)
@@ -206,65 +144,149 @@ class App(QWidget):
         for file in files:
             self.file_list.addItem(file)
 
-    def get_model_list(self):
-        url = "http://localhost:11434/v1/models"
-        try:
-            with urllib.request.urlopen(url) as response:
-                models = json.loads(response.read())
-                if 'data' in models and isinstance(models['data'], list):
-                    return [model['id'] for model in models['data']]
-        except Exception:
-            pass
-        return []
+    def refresh_model_list(self):
+        """在背景查詢 Ollama 的模型列表，結果經由事件佇列交給介面執行緒"""
+        refresh_models(lambda models, error: self.ui_events.post({"type": "models", "models": models, "error": error}))
+
+    def update_model_list(self, models, error):
+        if error is not None:
+            # 保留上次的模型列表，翻譯時 Ollama 若已啟動仍可使用
+            self.status_label.setText(f"無法取得模型列表，請確認 Ollama 是否已啟動 ({error})")
+            return
+        current = self.model_combo.currentText()
+        self.model_combo.clear()
+        self.model_combo.addItems(models)
+        self.model_combo.setCurrentText(current)
 
     def start_translation(self):
         self.progress_bar.setValue(0)
         self.status_label.setText("")
+        self.configure_engine()
+
         for i in range(self.file_list.count()):
             file_path = self.file_list.item(i).text()
-            thread = TranslationThread(
-                file_path, 
-                self.source_lang.currentText(), 
-                self.target_lang.currentText(), 
-                self.model_combo.currentText(),
-                self.parallel_requests.currentText(),
-                self.update_progress,
-                self.file_translated
-            )
-            thread.start()
+            self.add_file_row(file_path)
+            # 同一個檔案已在排程中時先取消，新的工作從進度日誌接續
+            self.jobs[file_path] = self.engine.submit(self.create_job(file_path), self.jobs.get(file_path))
 
         self.status_label.setText(f"正在翻譯 {self.file_list.count()} 個檔案...")
 
-    def update_progress(self, current, total, extra_data=None):
-        if extra_data and extra_data.get("type") == "file_conflict":
-            # 在主線程中顯示對話框
-            response = QMessageBox.warning(
-                self,
-                "檔案已存在",
-                f"檔案 {extra_data['path']} 已存在。\n是否覆蓋？\n'是' = 覆蓋\n'否' = 重新命名\n'取消' = 跳過",
-                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel
-            )
-            
-            # 轉換回應為字符串
-            if response == QMessageBox.Yes:
-                result = "overwrite"
-            elif response == QMessageBox.No:
-                result = "rename"
-            else:  # response is QMessageBox.Cancel
-                result = "skip"
-            
-            # 將結果發送回翻譯線程
-            extra_data["queue"].put(result)
+    def preview_selected(self):
+        """選取的檔案以預覽優先度翻譯，預覽範圍內的字幕最先完成"""
+        item = self.file_list.currentItem()
+        if item is None:
+            QMessageBox.information(self, "提示", "請先在清單中選取要預覽的檔案")
+            return
+        try:
+            window = parse_time_range(self.preview_range.text())
+        except ValueError as e:
+            QMessageBox.critical(self, "錯誤", str(e))
+            return
+        file_path = item.text()
+        self.configure_engine()
+        self.add_file_row(file_path)
+        # 同一個檔案已在排程中時先取消，新的工作從進度日誌接續
+        self.jobs[file_path] = self.engine.preview(self.create_job(file_path), window, self.jobs.get(file_path))
+        self.status_label.setText(f"{self.status_label.text()}\n正在預覽 {os.path.basename(file_path)} ({self.preview_range.text()})...")
+
+    def configure_engine(self):
+        processes = DEFAULT_PROCESSES if self.use_processes.isChecked() else 0
+        self.engine.configure(self.parallel_requests.currentText(), POLICY_NAMES[self.scheduling_policy.currentText()], processes)
+
+    def create_job(self, file_path):
+        return self.engine.create_job(
+            file_path,
+            self.source_lang.currentText(),
+            self.target_lang.currentText(),
+            self.model_combo.currentText(),
+            self.batch_size.currentText(),
+            "general",
+            stream=self.stream_output.isChecked()
+        )
+
+    def cancel_translation(self):
+        self.engine.cancel()
+        self.status_label.setText(f"{self.status_label.text()}\n正在取消翻譯...")
+
+    def add_file_row(self, file_path):
+        """在進度表中加入（或重設）一個檔案"""
+        row = self.file_rows.get(file_path)
+        if row is None:
+            row = QTreeWidgetItem([os.path.basename(file_path), "", ""])
+            self.file_progress.addTopLevelItem(row)
+            bar = QProgressBar()
+            self.file_progress.setItemWidget(row, 1, bar)
+            self.file_rows[file_path] = row
+        self.file_progress.itemWidget(row, 1).setValue(0)
+        row.setText(2, "等待中")
+
+    def process_ui_events(self):
+        """在介面執行緒中套用工作執行緒送來的更新，每個間隔只重畫一次"""
+        # 對話框開著時計時器仍會觸發，先停下來避免重入
+        self.ui_timer.stop()
+        try:
+            updates = self.ui_events.drain()
+            for file_path, (current, total) in updates.progress.items():
+                self.update_progress(file_path, current, total, updates.partial.get(file_path))
+            if updates.overall is not None:
+                self.update_overall_progress(*updates.overall)
+            for event in updates.events:
+                if event["type"] == "file_conflict":
+                    self.ask_file_conflict(event)
+                elif event["type"] == "models":
+                    self.update_model_list(event["models"], event["error"])
+                else:
+                    self.file_translated(event["path"], event["message"])
+        finally:
+            self.ui_timer.start()
+
+    def ask_file_conflict(self, extra_data):
+        # 在主線程中顯示對話框
+        response = QMessageBox.warning(
+            self,
+            "檔案已存在",
+            f"檔案 {extra_data['path']} 已存在。\n是否覆蓋？\n'是' = 覆蓋\n'否' = 重新命名\n'取消' = 跳過",
+            QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel
+        )
+        
+        # 轉換回應為字符串
+        if response == QMessageBox.Yes:
+            result = "overwrite"
+        elif response == QMessageBox.No:
+            result = "rename"
+        else:  # response is QMessageBox.Cancel
+            result = "skip"
+        
+        # 將結果發送回翻譯線程
+        extra_data["queue"].put(result)
+
+    def update_progress(self, file_path, current, total, partial=None):
+        """更新單一檔案在進度表中的列"""
+        row = self.file_rows.get(file_path)
+        if row is None or total <= 0:
             return
-            
-        # 正常的進度更新
-        if current >= 0 and total >= 0:
-            percentage = int(current / total * 100)
-            self.progress_bar.setValue(percentage)
-            self.status_label.setText(f"正在翻譯第 {current}/{total} 句字幕 ({percentage}%)")
-            QApplication.processEvents()
-
-    def file_translated(self, message):
+        bar = self.file_progress.itemWidget(row, 1)
+        bar.setMaximum(total)
+        bar.setValue(current)
+        bar.setFormat(f"{current}/{total} (%p%)")
+        status = "翻譯中"
+        if partial:
+            # 串流中的譯文，讓使用者看到模型正在輸出
+            status = " ".join(partial.split())[-40:]
+        row.setText(2, status)
+
+    def update_overall_progress(self, done, total):
+        """更新所有檔案的整體進度"""
+        if total > 0:
+            self.progress_bar.setValue(int(done / total * 100))
+            mode = "（自動調整）" if self.engine.concurrency is not None else ""
+            self.concurrency_label.setText(f"目前並行請求數: {self.engine.limit}{mode}")
+
+    def file_translated(self, file_path, message):
+        row = self.file_rows.get(file_path)
+        if row is not None:
+            # 訊息開頭為結果（翻譯完成、已跳過檔案、無法讀取檔案…），完整訊息顯示在狀態標籤
+            row.setText(2, message.split(" | ")[0].split(":")[0])
         current_text = self.status_label.text()
         self.status_label.setText(f"{current_text}\n{message}")
 
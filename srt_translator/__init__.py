@@ -0,0 +1,33 @@
+"""SRT 字幕翻譯器的共用翻譯核心。
+
+main.py、main v2.py、main_qt5.py 與命令列都透過 TranslationEngine 使用這裡的排程與工作邏輯。
+"""
+
+from .backends import BACKENDS
+from .concurrency import AUTO_CONCURRENCY, AdaptiveConcurrency
+from .dispatcher import POLICY_NAMES, PREVIEW_PRIORITY, TranslationDispatcher
+from .engine import TranslationEngine
+from .job import TranslationJob
+from .metrics import TranslationMetrics
+from .ollama_client import AsyncOllamaClient, OllamaClient, OllamaError
+from .translation_memory import TranslationMemory
+from .ui_events import UiEventQueue
+from .watcher import FolderWatcher
+
+__all__ = [
+    "AUTO_CONCURRENCY",
+    "BACKENDS",
+    "POLICY_NAMES",
+    "PREVIEW_PRIORITY",
+    "AdaptiveConcurrency",
+    "AsyncOllamaClient",
+    "FolderWatcher",
+    "OllamaClient",
+    "OllamaError",
+    "TranslationDispatcher",
+    "TranslationEngine",
+    "TranslationJob",
+    "TranslationMemory",
+    "TranslationMetrics",
+    "UiEventQueue",
+]
@@ -0,0 +1,121 @@
+import json
+
+from .errors import OllamaError
+
+
+class OpenAIChatBackend:
+    """OpenAI 相容的 /v1/chat/completions（Ollama、llama.cpp server、vLLM 等）
+
+    翻譯工作產生的請求內容本來就是這個格式，只需要去掉端點不認得的 keep_alive。
+    串流回應為 SSE（data: {...}，以 data: [DONE] 結束）。
+    """
+
+    name = "openai"
+    path = "/v1/chat/completions"
+
+    def request_body(self, payload, stream):
+        body = {key: value for key, value in payload.items() if key != "keep_alive"}
+        body["stream"] = stream
+        if stream:
+            body["stream_options"] = {"include_usage": True}  # 最後一個事件附上 token 用量
+        return body
+
+    def parse_response(self, result):
+        """回傳 (模型輸出的文字, token 用量)，用量為 {"prompt_tokens", "completion_tokens"}，伺服器沒提供的項目為 None"""
+        try:
+            content = result['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError):
+            raise OllamaError(f"無法解析的回應: {result!r}")
+        return content, self._usage(result)
+
+    def parse_stream_line(self, line):
+        """解析串流回應的一行，回傳 (文字片段, token 用量)，沒有的項目為 None"""
+        if not line.startswith(b"data:"):
+            return None, None
+        event = line[5:].strip()
+        if event == b"[DONE]":
+            return None, None
+        try:
+            result = json.loads(event)
+            choices = result['choices']
+            delta = choices[0]['delta'].get('content') if choices else None
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+            raise OllamaError(f"無法解析的串流回應: {event[:200]!r}")
+        return delta, self._usage(result) if result.get('usage') else None
+
+    def _usage(self, result):
+        usage = result.get('usage') or {}
+        return {"prompt_tokens": usage.get('prompt_tokens'), "completion_tokens": usage.get('completion_tokens')}
+
+
+class OllamaChatBackend:
+    """Ollama 原生的 /api/chat，可直接指定 keep_alive，串流回應為 NDJSON"""
+
+    name = "ollama_chat"
+    path = "/api/chat"
+    content_field = "message"
+
+    def request_body(self, payload, stream):
+        body = {"model": payload["model"], "messages": payload["messages"], "stream": stream}
+        return self._add_options(body, payload)
+
+    def _add_options(self, body, payload):
+        if "temperature" in payload:
+            body["options"] = {"temperature": payload["temperature"]}
+        if payload.get("keep_alive") is not None:
+            body["keep_alive"] = payload["keep_alive"]
+        return body
+
+    def _content(self, result):
+        return result['message']['content']
+
+    def parse_response(self, result):
+        try:
+            content = self._content(result)
+        except (KeyError, TypeError):
+            raise OllamaError(f"無法解析的回應: {result!r}")
+        return content, self._usage(result)
+
+    def parse_stream_line(self, line):
+        line = line.strip()
+        if not line:
+            return None, None
+        try:
+            result = json.loads(line)
+        except ValueError:
+            raise OllamaError(f"無法解析的串流回應: {line[:200]!r}")
+        if isinstance(result, dict) and "error" in result:
+            # Ollama 在串流途中發生錯誤時會送出 {"error": "..."}
+            raise OllamaError(f"Ollama 錯誤: {result['error']}")
+        try:
+            delta = self._content(result)
+        except (KeyError, TypeError):
+            raise OllamaError(f"無法解析的串流回應: {line[:200]!r}")
+        # 最後一行（done 為 true）附上 token 用量
+        return delta, self._usage(result) if result.get('done') else None
+
+    def _usage(self, result):
+        return {"prompt_tokens": result.get('prompt_eval_count'), "completion_tokens": result.get('eval_count')}
+
+
+class OllamaGenerateBackend(OllamaChatBackend):
+    """Ollama 原生的 /api/generate，系統提示與使用者訊息分別放在 system 與 prompt"""
+
+    name = "ollama_generate"
+    path = "/api/generate"
+
+    def request_body(self, payload, stream):
+        system = "\n".join(m["content"] for m in payload["messages"] if m["role"] == "system")
+        prompt = "\n".join(m["content"] for m in payload["messages"] if m["role"] != "system")
+        body = {"model": payload["model"], "system": system, "prompt": prompt, "stream": stream}
+        return self._add_options(body, payload)
+
+    def _content(self, result):
+        return result['response']
+
+
+# 命令列與設定中使用的名稱 -> 後端
+BACKENDS = {
+    backend.name: backend
+    for backend in (OpenAIChatBackend, OllamaChatBackend, OllamaGenerateBackend)
+}
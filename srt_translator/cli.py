@@ -0,0 +1,285 @@
+"""無圖形介面的批次翻譯入口
+
+    python -m srt_translator 影片1.srt 字幕資料夾/ "季/**/*.srt" --parallel 5
+    python -m srt_translator --watch 共用資料夾/ 另一個資料夾/
+
+進度以 JSON lines 輸出到 stdout，每行一個事件（progress、file_done、summary），
+方便由其他程式或 cron 記錄。結束代碼：0 全部成功、1 有檔案失敗、2 參數錯誤或找不到檔案、
+3 檔案都已保存但有字幕重試後仍未翻譯（保留原文）。
+
+--watch 時持續監看資料夾，新放入且已寫完的 SRT 檔自動加入翻譯佇列（已有輸出檔的略過），
+直到 Ctrl-C 或 SIGTERM 才輸出 summary 並結束；所有檔案共用同一個排程器、連線池與保持載入的模型。
+監看時另外輸出 watching、queued 與 skipped 事件。
+"""
+
+import argparse
+import codecs
+import glob
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+from .backends import BACKENDS
+from .concurrency import AUTO_CONCURRENCY
+from .dispatcher import POLICY_NAMES
+from .engine import DEFAULT_POOL_SIZE, TranslationEngine
+from .job import TranslationJob
+from .metrics import TranslationMetrics
+from .ollama_client import DEFAULT_BASE_URL
+from .prompts import SYSTEM_PROMPTS
+from .srt_io import parse_time_range
+from .translation_memory import DEFAULT_PATH as DEFAULT_MEMORY_PATH, TranslationMemory
+from .watcher import FolderWatcher
+
+DEFAULT_MODEL = "huihui_ai/aya-expanse-abliterated:latest"
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INCOMPLETE = 3
+
+
+class JsonProgressPrinter:
+    """把進度事件以 JSON lines 寫到 stdout，單一檔案的進度每變動 1% 才輸出一次"""
+
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self._lock = threading.Lock()
+        self._last_percent = {}
+
+    def emit(self, event, **fields):
+        line = json.dumps({"event": event, "time": round(time.time(), 3), **fields}, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def file_progress(self, file_path, current, total):
+        percent = int(current / total * 100) if total else 100
+        if self._last_percent.get(file_path) == percent:
+            return
+        self._last_percent[file_path] = percent
+        self.emit("progress", file=file_path, done=current, total=total, percent=percent)
+
+    def file_done(self, file_path, message):
+        self._last_percent.pop(file_path, None)
+        self.emit("file_done", file=file_path, message=message)
+
+
+class RunSummary:
+    """統計已結束的檔案，可從多個執行緒呼叫 add；不保留工作本身，長時間監看也不會累積記憶體"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files = 0
+        self.failed = []
+        self.untranslated = {}
+        self.cues = 0
+
+    def add(self, job):
+        if job.cancelled:
+            return  # 監看模式結束時取消的檔案，下次啟動從進度日誌接續
+        with self._lock:
+            self.files += 1
+            self.cues += job.total
+            if job.error is not None:
+                self.failed.append(job.file_path)
+            elif job.untranslated:
+                # 字幕編號從 1 開始，與播放器及 SRT 檔中的編號一致
+                self.untranslated[job.file_path] = sorted(index + 1 for index in job.untranslated)
+
+
+def collect_srt_files(patterns, target_lang):
+    """展開檔案、資料夾與萬用字元，排除已經是翻譯輸出的檔案"""
+    output_suffix = TranslationJob.LANG_SUFFIXES[target_lang] + ".srt"
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(glob.escape(pattern), "**", "*.srt"), recursive=True)
+        elif os.path.isfile(pattern):
+            matches = [pattern]
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        for path in sorted(matches):
+            if path.lower().endswith(output_suffix) or not path.lower().endswith(".srt"):
+                continue
+            path = os.path.abspath(path)
+            if path not in files:
+                files.append(path)
+    return files
+
+
+def parallel_value(value):
+    """--parallel 的值：正整數，或 auto 表示自動調整"""
+    if value in ("auto", AUTO_CONCURRENCY):
+        return None
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("並行請求數必須大於 0")
+    return number
+
+
+def encoding_value(value):
+    """--source-encoding、--output-encoding 的值：Python 認得的編碼名稱（輸出另可用 source）"""
+    if value == "source":
+        return value
+    try:
+        codecs.lookup(value)
+    except LookupError:
+        raise argparse.ArgumentTypeError(f"未知的編碼: {value}")
+    return value
+
+
+def window_value(value):
+    """--window 的值：開始-結束，例如 00:00-05:00 或 1:00:00-1:10:00"""
+    try:
+        return parse_time_range(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m srt_translator", description="不需圖形介面的 SRT 字幕批次翻譯")
+    parser.add_argument("paths", nargs="+", help="SRT 檔案、資料夾（遞迴搜尋）或萬用字元；--watch 時為要監看的資料夾")
+    parser.add_argument("--source-lang", default="日文", choices=["日文", "英文", "自動偵測"], help="原文語言")
+    parser.add_argument("--target-lang", default="繁體中文", choices=list(TranslationJob.LANG_SUFFIXES), help="目標語言")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Ollama 模型名稱")
+    parser.add_argument("--parallel", type=parallel_value, default=5, help="全域並行請求數，auto 表示依 Ollama 的表現自動調整")
+    parser.add_argument("--max-parallel", type=int, default=DEFAULT_POOL_SIZE, help="自動調整時的並行請求數上限")
+    parser.add_argument("--batch-size", type=int, default=1, help="每個請求合併翻譯的字幕句數")
+    parser.add_argument("--policy", default="fifo", choices=list(POLICY_NAMES.values()), help="多個檔案之間的排程策略")
+    parser.add_argument("--prompt", default="adult", choices=list(SYSTEM_PROMPTS), help="系統提示（adult 同 main.py，adult_context 同 main v2.py，general 同 main_qt5.py）")
+    parser.add_argument("--context", type=int, default=0, help="上下文模式：每句字幕前後各附上幾句原文作為參考，0 為逐句翻譯")
+    parser.add_argument("--window", type=window_value, help="先翻譯這段時間內的字幕（例如 00:00-05:00），其餘字幕接著翻譯")
+    parser.add_argument("--on-conflict", default="skip", choices=["skip", "overwrite", "rename"], help="輸出檔已存在時的處理方式")
+    parser.add_argument("--source-encoding", type=encoding_value, help="原檔編碼（例如 cp932、utf-16），預設依 BOM 與內容自動判斷")
+    parser.add_argument("--output-encoding", type=encoding_value, default="utf-8", help="輸出檔編碼，source 表示沿用原檔的編碼")
+    parser.add_argument("--no-stream", action="store_true", help="等待完整回應，不以串流接收譯文")
+    parser.add_argument("--processes", type=int, default=0, help="字幕檔的解析與寫出交給幾個子行程，0 表示在本行程中處理（大量檔案時可減少與網路排程搶 GIL）")
+    parser.add_argument("--no-dedupe", action="store_true", help="不合併同一檔案中重複的字幕")
+    parser.add_argument("--memory", default=DEFAULT_MEMORY_PATH, help="翻譯記憶資料庫路徑")
+    parser.add_argument("--no-memory", action="store_true", help="不使用翻譯記憶")
+    parser.add_argument("--url", default=DEFAULT_BASE_URL, help="Ollama 服務位址")
+    parser.add_argument("--backend", default="openai", choices=list(BACKENDS), help="翻譯請求使用的 API：OpenAI 相容端點或 Ollama 原生的 /api/chat、/api/generate")
+    parser.add_argument("--keep-alive", default=TranslationJob.keep_alive, help="翻完後模型保持載入的時間（Ollama 的 keep_alive 格式，例如 30m）")
+    parser.add_argument("--timeout", type=float, default=120, help="單一請求逾時秒數")
+    parser.add_argument("--retries", type=int, default=TranslationJob.max_retries, help="單一請求失敗時的重試次數")
+    parser.add_argument("--metrics-log", help="把每個請求與檔案的量測紀錄以 JSON lines 附加到這個檔案")
+    parser.add_argument("--metrics-port", type=int, help="在 http://127.0.0.1:PORT/metrics 提供 Prometheus 格式的量測值")
+    parser.add_argument("--watch", action="store_true", help="持續監看資料夾，自動翻譯新放入的 SRT 檔")
+    parser.add_argument("--settle", type=float, default=2.0, help="--watch 時檔案連續幾秒沒有變動才視為寫完")
+    parser.add_argument("--poll", action="store_true", help="--watch 時定期掃描而不使用 inotify（網路磁碟上的變動 inotify 收不到）")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="定期掃描的間隔秒數")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    printer = JsonProgressPrinter()
+
+    if args.watch:
+        missing = [path for path in args.paths if not os.path.isdir(path)]
+        if missing:
+            printer.emit("error", message=f"--watch 只能監看資料夾: {', '.join(missing)}")
+            return EXIT_USAGE
+        files = []
+    else:
+        files = collect_srt_files(args.paths, args.target_lang)
+        if not files:
+            printer.emit("error", message="找不到任何 SRT 檔案")
+            return EXIT_USAGE
+
+    memory = None if args.no_memory else TranslationMemory(args.memory)
+    metrics = TranslationMetrics(args.metrics_log)
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
+    engine = TranslationEngine(args.url, pool_size=args.max_parallel if args.parallel is None else args.parallel,
+                               timeout=args.timeout, backend=args.backend, memory=memory, metrics=metrics,
+                               exit_when_idle=not args.watch, processes=args.processes)
+    engine.configure(args.parallel, args.policy)
+    results = RunSummary()
+
+    def submit(file_path):
+        def on_progress(current, total, extra_data=None):
+            printer.file_progress(file_path, current, total)
+
+        def on_complete(message):
+            printer.file_done(file_path, message)
+            results.add(job)
+
+        job = engine.create_job(
+            file_path,
+            args.source_lang,
+            args.target_lang,
+            args.model,
+            args.batch_size,
+            args.prompt,
+            args.context,
+            not args.no_dedupe,
+            not args.no_stream,
+            on_conflict=args.on_conflict,
+            keep_alive=args.keep_alive,
+            max_retries=args.retries,
+            progress_callback=on_progress,
+            complete_callback=on_complete,
+            source_encoding=args.source_encoding,
+            output_encoding=args.output_encoding,
+            window=args.window,
+        )
+        engine.submit(job)
+
+    started = time.monotonic()
+    if args.watch:
+        watch(args, printer, engine, submit)
+    else:
+        for file_path in files:
+            submit(file_path)
+        engine.run()
+
+    summary = {
+        "files": results.files,
+        "failed": results.failed,
+        "untranslated": results.untranslated,
+        "cues": results.cues,
+        "seconds": round(time.monotonic() - started, 3),
+    }
+    if engine.concurrency is not None:
+        summary["parallel"] = engine.limit
+    summary["models"] = metrics.summary()
+    if memory is not None:
+        summary["memory"] = memory.stats()
+    engine.close()
+    printer.emit("summary", **summary)
+    if results.failed:
+        return EXIT_FAILED
+    return EXIT_INCOMPLETE if results.untranslated else EXIT_OK
+
+
+def watch(args, printer, engine, submit):
+    """監看資料夾直到 Ctrl-C 或 SIGTERM；翻譯中的檔案下次啟動時會從進度日誌接續"""
+    def on_file(file_path):
+        printer.emit("queued", file=file_path)
+        submit(file_path)
+
+    def on_skip(file_path):
+        printer.emit("skipped", file=file_path, reason="輸出檔已存在")
+
+    engine.start()
+    watcher = FolderWatcher(args.paths, on_file, args.target_lang, settle=args.settle,
+                            poll_interval=args.poll_interval, use_inotify=not args.poll, on_skip=on_skip)
+    watcher.start()
+    watcher.ready.wait(5)
+    printer.emit("watching", directories=watcher.directories, mode=watcher.mode)
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        while watcher.is_alive():
+            watcher.join(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        # 先讓排程器取消並結束在途的請求，翻譯記憶與量測紀錄才能在 close() 時關閉
+        engine.stop()
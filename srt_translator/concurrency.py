@@ -0,0 +1,98 @@
+import time
+
+# 並行請求數選單中的自動調整選項
+AUTO_CONCURRENCY = "自動"
+
+
+class AdaptiveConcurrency:
+    """依 Ollama 實際表現自動調整並行請求數
+
+    客戶端每完成一個請求就回報產生的 token 數（回應沒有 usage 時以字數代替），
+    每累積一個觀察窗口（至少 2 倍目前並行數的請求）就計算這段時間的每秒 token 數：
+      在目前的並行數先量測一個以上的窗口，再試著加一；
+      加一後吞吐量比目前並行數的平均高出 improvement 且延遲沒有超過
+      目前並行數下最低延遲的 latency_tolerance 倍，就採用新的並行數並繼續往上試，
+      否則退回原本的並行數，維持 hold_windows 個窗口後再試。
+    維持期間延遲超過容許範圍時減一；延遲的基準在每次改變並行數時重新量測，
+    換成較大的模型或較長的字幕使延遲持續上升時只會退一步，不會一路降到 min_limit。請求逾時、連線失敗或 429/5xx 時
+    立即乘以 decrease_factor（AIMD 的乘法遞減）。
+    limit 介於 min_limit 與 max_limit 之間，只在排程器的事件迴圈中更新。
+    """
+
+    def __init__(self, max_limit, min_limit=1, initial=2, decrease_factor=0.5,
+                 improvement=0.05, latency_tolerance=2.0, hold_windows=3):
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.limit = max(min_limit, min(self.max_limit, initial))
+        self.decrease_factor = decrease_factor
+        self.improvement = improvement
+        self.latency_tolerance = latency_tolerance
+        self.hold_windows = hold_windows
+
+        self._level = self.limit  # 目前採用的並行數，limit 大於它時表示正在試探
+        self._level_throughputs = []  # 目前並行數最近幾個窗口的每秒 token 數
+        self._base_latency = None  # 目前並行數下的最低平均延遲
+        self._hold = 0
+        self._start_window(time.monotonic())
+
+    def record(self, started, tokens):
+        """記錄一個成功的請求，started 為送出時的 time.monotonic()"""
+        now = time.monotonic()
+        self._requests += 1
+        self._tokens += tokens
+        self._latency += now - started
+        if self._requests >= max(4, 2 * self.limit):
+            self._adjust(now)
+
+    def record_error(self, started):
+        """記錄一個失敗的請求"""
+        if started < self._window_start:
+            return  # 上次調整並行數之前送出的請求，已經反映過了
+        self._set_level(int(self._level * self.decrease_factor))
+        self._start_window(time.monotonic())
+
+    def _adjust(self, now):
+        elapsed = now - self._window_start
+        throughput = self._tokens / elapsed if elapsed > 0 else 0.0
+        latency = self._latency / self._requests
+        if self.limit == self._level and (self._base_latency is None or latency < self._base_latency):
+            self._base_latency = latency
+        latency_ok = self._base_latency is None or latency <= self._base_latency * self.latency_tolerance
+
+        if self.limit > self._level:
+            average = sum(self._level_throughputs) / len(self._level_throughputs)
+            if latency_ok and throughput > average * (1 + self.improvement):
+                # 加大並行換來更高的吞吐量，採用並繼續往上試
+                self._set_level(self.limit)
+                self._base_latency = latency  # 這個窗口就是在新的並行數下量到的
+                self._level_throughputs.append(throughput)
+                self.limit = min(self.max_limit, self._level + 1)
+            else:
+                # 沒有改善，退回並暫停嘗試
+                self.limit = self._level
+                self._hold = self.hold_windows
+        elif not latency_ok:
+            self._set_level(self._level - 1)
+        else:
+            self._level_throughputs = self._level_throughputs[-self.hold_windows:] + [throughput]
+            if self._hold:
+                self._hold -= 1
+            else:
+                self.limit = min(self.max_limit, self._level + 1)
+        self._start_window(now)
+
+    def reset_latency(self):
+        """重新量測延遲基準（例如換了模型），保留目前的並行數"""
+        self._base_latency = None
+
+    def _set_level(self, limit):
+        self._level = self.limit = max(self.min_limit, min(self.max_limit, limit))
+        self._level_throughputs = []
+        self._hold = self.hold_windows
+        self._base_latency = None
+
+    def _start_window(self, now):
+        self._window_start = now
+        self._requests = 0
+        self._tokens = 0
+        self._latency = 0.0
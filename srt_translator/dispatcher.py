@@ -0,0 +1,269 @@
+import asyncio
+import functools
+import queue
+import threading
+
+# 介面顯示名稱 -> 排程策略
+POLICY_NAMES = {
+    "先進先出": "fifo",
+    "最短優先": "shortest",
+    "輪流": "round_robin",
+}
+
+# 互動預覽工作的優先度，一般（背景批次）工作為 0
+PREVIEW_PRIORITY = 10
+
+
+class TranslationDispatcher(threading.Thread):
+    """所有佇列中檔案共用的翻譯排程器
+
+    全部檔案的字幕請求都是同一個長駐事件迴圈上的協程，總在途請求數不超過
+    max_in_flight（有提供 concurrency 時改由 AdaptiveConcurrency 調整）。
+    policy 決定下一個派送的檔案：
+      fifo        依加入順序，前一個檔案派送完才輪到下一個
+      shortest    字幕句數最少的檔案優先
+      round_robin 各檔案輪流各派送一個請求
+    """
+
+    def __init__(self, max_in_flight, policy="fifo", progress_callback=None, exit_when_idle=False, concurrency=None):
+        threading.Thread.__init__(self, daemon=True)
+        if policy not in POLICY_NAMES.values():
+            raise ValueError(f"未知的排程策略: {policy}")
+        self.max_in_flight = max_in_flight
+        self.policy = policy
+        self.progress_callback = progress_callback  # 整體進度 (已完成句數, 總句數)
+        self.exit_when_idle = exit_when_idle
+        self.concurrency = concurrency
+
+        self._submissions = queue.Queue()
+        self._cancellations = queue.Queue()
+        self._loop = None
+        self._wakeup = None
+        self._tasks = set()  # 保留在途請求與背景工作的參照，避免被回收
+
+        self._jobs = []  # 已載入、尚未完成的工作
+        self._loading = set()  # 讀取中的工作
+        self._unit_jobs = {}  # 在途請求 -> 所屬的工作
+        self._finishing = 0
+        self._in_flight = 0
+        self._round_robin = 0
+        self._sequence = 0  # 下一個加入的工作的順序編號
+        self._done_cues = 0
+        self._total_cues = 0
+
+    def submit(self, job):
+        """加入一個翻譯工作（可從任何執行緒呼叫）"""
+        self._submissions.put(job)
+        self._notify()
+
+    def cancel(self, job=None):
+        """取消一個翻譯工作，job 為 None 時取消全部尚未完成的工作（可從任何執行緒呼叫）
+
+        在途請求立即中止，已翻譯的字幕保留在進度日誌中，之後重新加入同一個檔案會從中斷處接續。
+        已經在存檔的工作不受影響；被取消的工作以「已取消」訊息呼叫 complete_callback。
+        """
+        self._cancellations.put(job)
+        self._notify()
+
+    def stop(self, timeout=None):
+        """等在途請求與存檔都結束後離開事件迴圈，並等待執行緒結束（可從其他執行緒呼叫）"""
+        self.exit_when_idle = True
+        self._notify()
+        if self.is_alive():
+            self.join(timeout)
+
+    def configure(self, max_in_flight, policy, concurrency=None):
+        """調整全域並行上限、排程策略與自動調整，對之後派送的請求生效"""
+        if policy not in POLICY_NAMES.values():
+            raise ValueError(f"未知的排程策略: {policy}")
+        self.max_in_flight = max_in_flight
+        self.policy = policy
+        self.concurrency = concurrency
+        self._notify()
+
+    @property
+    def limit(self):
+        """目前的全域在途請求上限"""
+        concurrency = self.concurrency
+        return concurrency.limit if concurrency is not None else self.max_in_flight
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._dispatch())
+        finally:
+            loop.close()
+
+    def _notify(self):
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _dispatch(self):
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        while True:
+            self._accept_cancellations()
+            self._accept_submissions()
+            self._fill_slots()
+            if self.exit_when_idle and self._is_idle():
+                break
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+    def _is_idle(self):
+        return (self._submissions.empty() and not self._jobs and not self._tasks
+                and not self._loading and self._finishing == 0)
+
+    def _accept_cancellations(self):
+        while True:
+            try:
+                job = self._cancellations.get_nowait()
+            except queue.Empty:
+                return
+            if job is None:
+                # 全部取消：包含還在佇列中、讀取中與翻譯中的工作
+                self._accept_submissions(cancel_all=True)
+                for loading in self._loading:
+                    loading.cancelled = True
+                for active in list(self._jobs):
+                    self._cancel_job(active)
+            elif job in self._jobs:
+                self._cancel_job(job)
+            else:
+                # 還沒載入完成，載入後直接結束
+                job.cancelled = True
+
+    def _cancel_job(self, job):
+        job.cancelled = True
+        job.pending.clear()
+        self._jobs.remove(job)
+        for task, owner in list(self._unit_jobs.items()):
+            if owner is job:
+                task.cancel()
+        self._total_cues -= job.total - job.reported
+        self._report_progress()
+        if job.journal is not None:
+            job.journal.close()  # 保留進度日誌，之後可以接續
+        job.complete_callback(f"已取消翻譯: {job.file_path}")
+
+    def _accept_submissions(self, cancel_all=False):
+        if not cancel_all:
+            # 先取消、再重新加入同一個檔案時（例如改為預覽），確保舊的工作先結束
+            self._accept_cancellations()
+        while True:
+            try:
+                job = self._submissions.get_nowait()
+            except queue.Empty:
+                return
+            if cancel_all:
+                job.cancelled = True
+            if job.cancelled:
+                job.complete_callback(f"已取消翻譯: {job.file_path}")
+                continue
+            # 依加入順序編號：fifo 依此挑選，不受各檔案讀取完成的先後影響
+            job.sequence = self._sequence
+            self._sequence += 1
+            # 讀取字幕檔交給背景執行緒，避免大型檔案卡住派送
+            self._loading.add(job)
+            future = self._loop.run_in_executor(None, job.load)
+            future.add_done_callback(functools.partial(self._job_loaded, job))
+
+    def _job_loaded(self, job, future):
+        self._loading.discard(job)
+        try:
+            future.result()
+        except Exception as e:
+            job.error = e
+            job.complete_callback(f"無法讀取檔案: {job.file_path} ({e})")
+        else:
+            if job.cancelled:
+                if job.journal is not None:
+                    job.journal.close()
+                job.complete_callback(f"已取消翻譯: {job.file_path}")
+                self._wakeup.set()
+                return
+            self._total_cues += job.total
+            self._jobs.append(job)
+            # 從進度日誌接續的字幕在載入時就已完成
+            self._done_cues += job.complete_cues({})
+            self._report_progress()
+            if job.is_done():  # 空白字幕檔
+                self._start_finish(job)
+        self._wakeup.set()
+
+    def _pick_job(self):
+        """只在有待派送請求、優先度最高的檔案中依 policy 挑選
+
+        優先度較高的檔案不會中止在途的請求，而是取得之後每一個空出來的位置。
+        """
+        candidates = [job for job in self._jobs if job.has_pending()]
+        if not candidates:
+            return None
+        top = max(job.priority for job in candidates)
+        candidates = [job for job in candidates if job.priority == top]
+        if self.policy == "shortest":
+            return min(candidates, key=lambda job: job.total)
+        if self.policy == "round_robin":
+            self._round_robin += 1
+            return candidates[self._round_robin % len(candidates)]
+        return min(candidates, key=lambda job: job.sequence)
+
+    def _fill_slots(self):
+        while self._in_flight < self.limit:
+            job = self._pick_job()
+            if job is None:
+                return
+            unit = job.next_unit()
+            self._in_flight += 1
+            task = self._loop.create_task(job.translate_unit(unit))
+            self._tasks.add(task)
+            self._unit_jobs[task] = job
+            task.add_done_callback(functools.partial(self._unit_done, job, unit))
+
+    def _unit_done(self, job, unit, task):
+        self._tasks.discard(task)
+        self._unit_jobs.pop(task, None)
+        self._in_flight -= 1
+        if task.cancelled() or job.cancelled:
+            self._wakeup.set()
+            return
+        try:
+            results = task.result()
+        except Exception:
+            results = dict.fromkeys(unit)
+        self._done_cues += job.complete_cues(results)
+        self._report_progress()
+        if job.is_done():
+            self._start_finish(job)
+        self._wakeup.set()
+
+    def _start_finish(self, job):
+        # 存檔時可能要等待使用者處理檔案衝突，放到背景執行緒
+        self._jobs.remove(job)
+        task = self._loop.create_task(job.keep_model_loaded())
+        self._tasks.add(task)
+        task.add_done_callback(self._background_done)
+        self._finishing += 1
+        future = self._loop.run_in_executor(None, self._finish_job, job)
+        future.add_done_callback(self._job_finished)
+
+    def _finish_job(self, job):
+        try:
+            job.finish()
+        except Exception as e:
+            job.error = e
+            job.complete_callback(f"無法保存檔案: {job.file_path} ({e})")
+
+    def _background_done(self, task):
+        self._tasks.discard(task)
+        self._wakeup.set()
+
+    def _job_finished(self, future):
+        self._finishing -= 1
+        self._wakeup.set()
+
+    def _report_progress(self):
+        if self.progress_callback:
+            self.progress_callback(self._done_cues, self._total_cues)
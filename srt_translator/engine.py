@@ -0,0 +1,204 @@
+import concurrent.futures
+import multiprocessing
+import os
+
+from .backends import BACKENDS
+from .concurrency import AUTO_CONCURRENCY, AdaptiveConcurrency
+from .dispatcher import PREVIEW_PRIORITY, TranslationDispatcher
+from .job import TranslationJob
+from .metrics import DEFAULT_PATH as DEFAULT_METRICS_PATH, TranslationMetrics
+from .ollama_client import DEFAULT_BASE_URL, AsyncOllamaClient
+from .prompts import SYSTEM_PROMPTS
+from .translation_memory import TranslationMemory
+from .ui_events import UiEventQueue
+
+# 沒有設定 OLLAMA_NUM_PARALLEL 時的連線池大小，也是介面並行請求數選單的上限
+DEFAULT_POOL_SIZE = 8
+# 多行程讀寫字幕檔時的子行程數，讀寫只佔翻譯時間的一小部分，不需要用滿所有核心
+DEFAULT_PROCESSES = min(4, os.cpu_count() or 1)
+
+
+def default_pool_size():
+    """連線池大小：與 Ollama 服務端相同的環境變數 OLLAMA_NUM_PARALLEL，沒有設定時為 DEFAULT_POOL_SIZE"""
+    try:
+        return max(1, int(os.environ.get('OLLAMA_NUM_PARALLEL', DEFAULT_POOL_SIZE)))
+    except ValueError:
+        return DEFAULT_POOL_SIZE
+
+
+class TranslationEngine:
+    """圖形介面與命令列共用的翻譯核心
+
+    持有連線池、排程器、翻譯記憶與量測紀錄，前端只需要：
+      configure(並行數, 排程策略)  並行數為 "auto"、AUTO_CONCURRENCY 或 None 時自動調整，
+                                   其他值不超過連線池大小
+      create_job(檔案, ...)        依翻譯選項建立 TranslationJob，submit(job) 加入排程
+      preview(job, window)         把工作改為互動預覽：window 時間範圍內的字幕先翻，
+                                   並優先於其他檔案派送
+      cancel(job=None)             取消一個檔案或全部檔案，已翻譯的部分下次接續
+      stop()                       常駐時結束：取消全部工作並等排程器停止
+      close()                      結束時關閉翻譯記憶、量測紀錄與子行程
+    進度預設送到 events（UiEventQueue），介面執行緒以計時器呼叫 events.drain() 套用；
+    命令列可以在 create_job 指定自己的 progress_callback 與 complete_callback。
+
+    exit_when_idle 為 False（圖形介面、監看模式）時，排程器在第一次 submit 時於背景
+    執行緒啟動並一直執行；為 True（批次）時加入所有檔案後呼叫 run()，全部完成才返回。
+
+    processes 大於 0 時，字幕檔的解析、原文整理與寫出交給這麼多個子行程（srt_io），
+    大量檔案同時讀寫也不會拖慢介面與排程器；翻譯請求仍只在排程器所在的行程中送出。
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, pool_size=None, timeout=120, backend="openai",
+                 memory=None, metrics=None, events=None, exit_when_idle=False, processes=0):
+        self.pool_size = pool_size or default_pool_size()
+        self.client = AsyncOllamaClient(base_url, pool_size=self.pool_size, timeout=timeout,
+                                        backend=BACKENDS[backend]())
+        self.memory = memory
+        self.metrics = metrics
+        self.events = events if events is not None else UiEventQueue()
+        self.concurrency = None
+        self.dispatcher = TranslationDispatcher(self.pool_size, progress_callback=self.events.overall_callback,
+                                                exit_when_idle=exit_when_idle)
+        self.exit_when_idle = exit_when_idle
+        self.processes = processes
+        self._process_pool = None
+        self._pool_processes = 0
+        self._started = False
+
+    @classmethod
+    def with_defaults(cls, **kwargs):
+        """開啟預設位置的翻譯記憶與量測紀錄（圖形介面使用），無法開啟時只印出警告
+
+        量測紀錄寫到 ~/.srt_translator/metrics.jsonl；設定 SRT_METRICS_PORT 時
+        另在 http://127.0.0.1:PORT/metrics 提供 Prometheus 格式。
+        """
+        try:
+            memory = TranslationMemory()
+        except Exception as e:
+            memory = None
+            print(f"警告：無法開啟翻譯記憶，將不使用快取 ({e})")
+        try:
+            metrics = TranslationMetrics(DEFAULT_METRICS_PATH)
+            if os.environ.get('SRT_METRICS_PORT'):
+                metrics.serve(int(os.environ['SRT_METRICS_PORT']))
+        except Exception as e:
+            metrics = None
+            print(f"警告：無法記錄量測資料 ({e})")
+        return cls(memory=memory, metrics=metrics, **kwargs)
+
+    def configure(self, parallel=None, policy="fifo", processes=None):
+        """調整全域並行請求數與排程策略，對之後派送的請求生效；processes 不是 None 時一併調整子行程數"""
+        if processes is not None:
+            self.processes = processes
+        if parallel in (None, "auto", AUTO_CONCURRENCY):
+            # 自動調整時最多用到連線池的大小；已經在自動調整時沿用原本的控制器，保留已學到的並行數
+            max_in_flight = self.pool_size
+            if self.concurrency is None:
+                self.concurrency = AdaptiveConcurrency(max_in_flight)
+            else:
+                # 可能換了模型或批次設定，延遲基準要重新量測
+                self.concurrency.reset_latency()
+        else:
+            max_in_flight = max(1, min(int(parallel), self.pool_size))
+            self.concurrency = None
+        self.client.observer = self.concurrency
+        self.dispatcher.configure(max_in_flight, policy, self.concurrency)
+
+    @property
+    def limit(self):
+        """目前的全域在途請求上限"""
+        return self.dispatcher.limit
+
+    def create_job(self, file_path, source_lang, target_lang, model_name, batch_size=1, prompt="adult",
+                   context_radius=0, dedupe=True, stream=True, on_conflict=None, keep_alive=None,
+                   max_retries=None, progress_callback=None, complete_callback=None, source_encoding=None,
+                   output_encoding="utf-8", priority=0, window=None):
+        """建立一個檔案的翻譯工作；prompt 為 SYSTEM_PROMPTS 的名稱，context_radius 大於 0 時為上下文模式"""
+        job = TranslationJob(
+            file_path,
+            source_lang,
+            target_lang,
+            model_name,
+            self.dispatcher.max_in_flight,
+            progress_callback or self.events.progress_callback,
+            complete_callback or self.events.completion_callback(file_path),
+            self.client,
+            int(batch_size),
+            self.memory,
+            dedupe,
+            stream,
+            self.metrics,
+            context_radius=context_radius,
+            system_prompt=SYSTEM_PROMPTS[prompt],
+            on_conflict=on_conflict,
+            process_pool=self.process_pool(),
+            source_encoding=source_encoding,
+            output_encoding=output_encoding,
+            priority=priority,
+            window=window,
+        )
+        if keep_alive is not None:
+            job.keep_alive = keep_alive
+        if max_retries is not None:
+            job.max_retries = max_retries
+        return job
+
+    def preview(self, job, window, previous=None):
+        """以預覽優先度把 job 加入排程，window 為 (開始毫秒, 結束毫秒)，previous 同 submit"""
+        job.priority = PREVIEW_PRIORITY
+        job.window = window
+        return self.submit(job, previous)
+
+    def process_pool(self):
+        """目前設定的子行程池，processes 為 0 時回傳 None"""
+        if self._pool_processes != self.processes:
+            # 舊的子行程池仍由已建立的工作持有，等它們都結束後自然關閉
+            self._process_pool = None
+        if self._process_pool is None and self.processes > 0:
+            # 以 spawn 建立子行程：fork 會複製介面、排程器與量測伺服器的執行緒持有中的鎖，可能卡死
+            self._process_pool = concurrent.futures.ProcessPoolExecutor(
+                self.processes, mp_context=multiprocessing.get_context("spawn"))
+            self._pool_processes = self.processes
+        return self._process_pool
+
+    def submit(self, job, previous=None):
+        """把工作加入排程（可從任何執行緒呼叫）
+
+        previous 是同一個檔案先前加入的工作時先取消它（已翻譯的字幕保留在進度日誌中，
+        新的工作會從中斷處接續），避免兩個工作同時寫同一個進度日誌與輸出檔。
+        """
+        if previous is not None:
+            self.cancel(previous)
+        self.dispatcher.submit(job)
+        if not self.exit_when_idle:
+            self.start()
+        return job
+
+    def cancel(self, job=None):
+        """取消一個工作，job 為 None 時取消全部（可從任何執行緒呼叫）"""
+        self.dispatcher.cancel(job)
+
+    def start(self):
+        """在背景執行緒中啟動排程器"""
+        if not self._started:
+            self._started = True
+            self.dispatcher.start()
+
+    def run(self):
+        """在目前的執行緒中執行排程器，exit_when_idle 時全部檔案完成才返回"""
+        self._started = True
+        self.dispatcher.run()
+
+    def stop(self, timeout=None):
+        """取消全部工作，等排程器處理完取消與存檔後結束，之後才能安全地 close()"""
+        self.cancel()
+        self.dispatcher.stop(timeout)
+
+    def close(self):
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+            self._process_pool = None
+        if self.metrics is not None:
+            self.metrics.close()
+        if self.memory is not None:
+            self.memory.close()
@@ -0,0 +1,15 @@
+class OllamaError(Exception):
+    """Ollama 回傳錯誤狀態碼或無法解析的回應"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status  # HTTP 狀態碼，回應無法解析時為 None
+
+    @property
+    def retryable(self):
+        # 4xx（模型不存在、參數錯誤等）重試也不會成功，429 與 5xx 則可能只是暫時過載
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+class InvalidResponse(OllamaError):
+    """模型輸出明顯無效（開場白、拒絕或長度失控），已中止生成"""
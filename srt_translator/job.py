@@ -0,0 +1,470 @@
+import asyncio
+import collections
+import contextvars
+import hashlib
+import os
+import random
+import threading
+import time
+from queue import Queue
+
+from .dispatcher import TranslationDispatcher
+from .journal import TranslationJournal, file_signature
+from .ollama_client import AsyncOllamaClient, InvalidResponse, OllamaError
+from .prompts import check_translation, parse_batch_response, prompt_layout
+from .srt_io import read_cues, write_cues
+from .translation_memory import make_key
+
+# 目前這組字幕在排程器佇列中等待的秒數，計入它第一個請求的 queue_wait
+_unit_wait = contextvars.ContextVar("unit_wait", default=0.0)
+
+
+class TranslationJob(threading.Thread):
+    """單一 SRT 檔案的翻譯工作
+
+    交給 TranslationDispatcher 與其他檔案共用並行額度，或直接 start() 以單檔模式執行；
+    需要不同的請求內容時可覆寫 fetch。
+    """
+
+    system_prompt = ""  # 可由建構參數 system_prompt 覆寫
+
+    max_retries = 3          # 逾時、連線失敗或過載（429/5xx）時以帶抖動的指數退避重試的次數
+    retry_backoff = 1.0      # 第一次重試前的最長等待秒數，之後每次加倍
+    retry_backoff_max = 30.0
+    max_requeues = 1         # 重試後仍失敗的字幕最多再排到佇列最後重試幾輪，之後保留原文並列入 untranslated
+    partial_interval = 0.2   # 串流時回報接收中譯文的最短間隔秒數
+    keep_alive = "30m"       # 檔案翻完後模型保持載入的時間，None 表示依 Ollama 預設
+
+    # 目標語言 -> 輸出檔名後綴
+    LANG_SUFFIXES = {"繁體中文": ".zh_tw", "英文": ".en", "日文": ".jp"}
+
+    def __init__(self, file_path, source_lang, target_lang, model_name, parallel_requests, progress_callback, complete_callback, client=None, batch_size=1, memory=None, dedupe=True, stream=True, metrics=None, context_radius=0, system_prompt=None, on_conflict=None, process_pool=None, source_encoding=None, output_encoding='utf-8', priority=0, window=None):
+        threading.Thread.__init__(self)
+        self.file_path = file_path
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        self.model_name = model_name
+        self.parallel_requests = parallel_requests
+        self.progress_callback = progress_callback
+        self.complete_callback = complete_callback
+        # 多個工作應共用同一個 client，才能沿用連線池中的連線；
+        # client 必須與排程器在同一個事件迴圈中使用
+        self.client = client or AsyncOllamaClient(pool_size=int(parallel_requests))
+        self.batch_size = max(1, int(batch_size))  # 大於 1 時合併連續字幕成一個請求，結果對不上時拆回逐句
+        self.memory = memory  # TranslationMemory，只有未命中的字幕才呼叫模型
+        self.dedupe = dedupe  # 內容相同（且上下文相同）的字幕只送出第一句
+        self.stream = stream  # 串流接收譯文，輸出無效時立即中止重來
+        self.metrics = metrics  # TranslationMetrics，記錄每個請求與各階段耗時
+        self.context_radius = max(0, int(context_radius))  # 每句字幕前後各附上幾句作為上下文，0 表示逐句翻譯
+        self.on_conflict = on_conflict  # 輸出檔已存在時：overwrite、rename、skip，None 表示詢問介面
+        self.process_pool = process_pool  # ProcessPoolExecutor，解析與寫檔交給子行程
+        self.source_encoding = source_encoding  # None 表示自動判斷
+        self.output_encoding = output_encoding  # "source" 表示沿用原檔的編碼
+        self.priority = priority  # 越大越先派送，見 dispatcher.PREVIEW_PRIORITY
+        self.window = window  # 優先翻譯的時間範圍 (開始毫秒, 結束毫秒)，None 表示依字幕順序
+        if system_prompt is not None:
+            self.system_prompt = system_prompt
+        # 系統提示一改，舊的翻譯記憶就不再適用
+        self.prompt_version = hashlib.sha256(self.system_prompt.encode('utf-8')).hexdigest()[:12]
+        # 每個請求開頭逐位元組相同，讓 Ollama 能沿用前一個請求的 KV cache
+        self.prompt = prompt_layout(self.system_prompt, target_lang)
+        self.cache_hits = 0
+        self.error = None  # 讀取或保存失敗時由排程器記錄
+        self.cancelled = False  # 由排程器的 cancel 設定
+        self.sequence = 0  # 由排程器設定的加入順序
+
+        self.output_path = None
+        self.journal = None
+        self.resumed = 0
+        self.document = None  # 原文與各句字幕的時間、位置
+        self.source_texts = []  # 原文，不會隨譯文套用而改變
+        self.normalized_texts = []  # 正規化後的原文，用來比對重複字幕
+        self.output_texts = []  # 套用譯文後的字幕內容
+        self.total = 0
+        self.pending = collections.deque()  # 待派送的請求，每個是一組連續字幕索引
+        self.queued_at = {}  # 待派送請求的第一個索引 -> 排入佇列的時間
+        self.results = {}  # 已完成但尚未套用的結果
+        self.finished = bytearray()  # 各句字幕是否已完成
+        self.reported = 0  # 已完成的句數
+        self.duplicates = {}  # 實際送出的字幕索引 -> 其他內容相同的字幕索引
+        self.requeues = collections.Counter()
+        self.untranslated = []  # 最終沒有譯文、保留原文的字幕索引
+        self.rejected = 0  # 因輸出無效而中止重來的請求數
+        self._partial_reported = 0.0
+        self.timings = {}  # 各階段秒數：load、wait（排隊等待第一個請求）、translate、save
+        self._loaded_at = None
+        self._first_request = None
+
+    def run(self):
+        # 單檔模式：只有自己一個工作的排程器，跑完即結束
+        dispatcher = TranslationDispatcher(int(self.parallel_requests), exit_when_idle=True)
+        dispatcher.submit(self)
+        dispatcher.run()
+
+    def load(self):
+        """決定輸出路徑、讀取字幕與進度日誌，並建立待翻譯佇列
+
+        進度日誌中已有的譯文直接套用；有 window 時與其重疊的字幕先排入佇列。
+        """
+        started = time.monotonic()
+        self.timings = {}
+        self._first_request = None
+        self.output_path = self.get_output_path()
+        if not self.output_path:  # 使用者選擇跳過，不需要翻譯
+            return
+
+        # 在子行程中讀取時只有時間軸、文字位置與各句原文會傳回來，整份原文留在子行程
+        self.document, self.source_texts, self.normalized_texts = self.run_cpu(
+            read_cues, self.file_path, self.source_encoding, self.process_pool is not None)
+        self.total = len(self.source_texts)
+        self.output_texts = list(self.source_texts)
+
+        signature = file_signature(self.file_path, self.model_name, self.target_lang, self.prompt_version)
+        self.journal = TranslationJournal(self.output_path, signature)
+        resumed = {index: text for index, text in self.journal.load().items() if index < self.total}
+        self.resumed = len(resumed)
+        self.journal.open(resumed=bool(resumed))
+
+        self.duplicates = {}
+        if self.dedupe:
+            first_seen = {}
+            unique = []
+            for index in range(self.total):
+                key = self.dedupe_key(index)
+                if key in first_seen:
+                    self.duplicates.setdefault(first_seen[key], []).append(index)
+                else:
+                    first_seen[key] = index
+                    unique.append(index)
+        else:
+            unique = list(range(self.total))
+
+        # 日誌中已有譯文的字幕不再送出，由排程器在載入後一併套用
+        self.results = {}
+        for index in unique:
+            if index in resumed:
+                self.results[index] = resumed[index]
+                for duplicate in self.duplicates.get(index, ()):
+                    self.results[duplicate] = resumed.get(duplicate, resumed[index])
+        unique = [index for index in unique if index not in self.results]
+
+        units = []
+        for index in unique:
+            # 上下文模式下一批只放連續的字幕（去重或接續後中間可能有空隙），
+            # 否則這批的上下文會涵蓋整段空隙
+            if (units and len(units[-1]) < self.batch_size
+                    and (not self.context_radius or index == units[-1][-1] + 1)):
+                units[-1].append(index)
+            else:
+                units.append([index])
+        if self.window is not None:
+            # 時間範圍內的字幕先送出，範圍內外各自維持原本的順序
+            first = [unit for unit in units if self.in_window(unit)]
+            units = first + [unit for unit in units if not self.in_window(unit)]
+        self.pending = collections.deque(units)
+        now = time.monotonic()
+        self.queued_at = {unit[0]: now for unit in units}
+        self.finished = bytearray(self.total)
+        self.reported = 0
+        self.requeues = collections.Counter()
+        self.untranslated = []
+        self.rejected = 0
+        self._loaded_at = time.monotonic()
+        self.timings["load"] = self._loaded_at - started
+
+    def in_window(self, indices):
+        """這組字幕（含內容相同、共用譯文的字幕）是否有任一句與 window 重疊"""
+        start, end = self.window
+        starts, ends = self.document.starts, self.document.ends
+        for index in indices:
+            for cue in (index, *self.duplicates.get(index, ())):
+                if starts[cue] < end and ends[cue] > start:
+                    return True
+        return False
+
+    def run_cpu(self, func, *args):
+        """執行解析或寫檔，有 process_pool 時在子行程中執行並等待結果"""
+        if self.process_pool is None:
+            return func(*args)
+        return self.process_pool.submit(func, *args).result()
+
+    def has_pending(self):
+        return bool(self.pending)
+
+    def next_unit(self):
+        return self.pending.popleft()
+
+    async def translate_unit(self, indices):
+        """翻譯一組連續字幕（在排程器的事件迴圈中執行），回傳 {索引: 譯文}"""
+        _unit_wait.set(time.monotonic() - self.queued_at.pop(indices[0], time.monotonic()))
+        if self._first_request is None:
+            self._first_request = time.monotonic()
+            self.timings["wait"] = self._first_request - self._loaded_at
+        # 空白字幕不需要翻譯
+        results = {index: self.source_texts[index] for index in indices if not self.source_texts[index].strip()}
+        indices = [index for index in indices if index not in results]
+        if not indices:
+            return results
+
+        loop = asyncio.get_running_loop()
+        if self.memory is not None:
+            # SQLite 的查詢與更新在背景執行緒進行，不卡住事件迴圈上其他串流中的請求
+            keys = {index: self.cache_key(index) for index in indices}
+            cached = await loop.run_in_executor(None, self.memory.get_many, list(keys.values()))
+            hits = 0
+            for index, key in keys.items():
+                if key in cached:
+                    results[index] = cached[key]
+                    hits += 1
+            self.cache_hits += hits
+            if hits and self.metrics is not None:
+                self.metrics.record_cache_hits(self, hits)
+            indices = [index for index in indices if index not in results]
+            if not indices:
+                return results
+
+        if len(indices) == 1:
+            translations = [await self.translate_cue(indices[0])]
+        else:
+            translations = await self.translate_batch(indices)
+            if translations is None:
+                # 批次結果的數量或編號對不上，拆回逐句請求重新排隊
+                self.pending.extendleft([index] for index in reversed(indices))
+                now = time.monotonic()
+                self.queued_at.update((index, now) for index in indices)
+                return results
+
+        stored = []
+        for index, translation in zip(indices, translations):
+            if not translation and self.requeues[index] < self.max_requeues:
+                # 重試後仍失敗，移到佇列最後，等其他字幕翻完再試
+                self.requeues[index] += 1
+                self.pending.append([index])
+                self.queued_at[index] = time.monotonic()
+                continue
+            results[index] = translation
+            if translation and self.memory is not None:
+                stored.append((self.cache_key(index), translation))
+        if stored:
+            await loop.run_in_executor(None, self.memory.put_many, stored)
+        return results
+
+    def cache_key(self, index):
+        return make_key(self.model_name, self.target_lang, self.prompt_version,
+                        self.source_texts[index], self.cache_context(index))
+
+    def dedupe_key(self, index):
+        if self.context_radius:
+            return tuple(self.normalized_texts[max(0, index - self.context_radius):index + 1 + self.context_radius])
+        return self.normalized_texts[index]
+
+    def cache_context(self, index):
+        """會影響譯文的上下文，逐句翻譯時不依賴上下文"""
+        return self.context_texts(index, index + 1) if self.context_radius else None
+
+    def context_texts(self, start, end):
+        # 上下文取自載入時建立的原文陣列，不需要在 SubRipFile 中搜尋目前字幕的位置
+        return self.source_texts[max(0, start - self.context_radius):end + self.context_radius]
+
+    async def translate_cue(self, index):
+        text = self.source_texts[index]
+        if self.context_radius:
+            context_texts = self.context_texts(index, index + 1)
+            return await self.request_translation(self.prompt.context(text, context_texts), [text])
+        return await self.fetch(text)
+
+    async def translate_batch(self, indices):
+        texts = [self.source_texts[index] for index in indices]
+        context_texts = self.context_texts(indices[0], indices[-1] + 1) if self.context_radius else None
+        return await self.fetch_batch(texts, context_texts)
+
+    async def fetch_batch(self, texts, context_texts=None):
+        content = await self.request_translation(self.prompt.batch(texts, context_texts), texts)
+        return parse_batch_response(content, len(texts)) if content else None
+
+    async def request_translation(self, user_content, source_texts=()):
+        """以共用的系統提示送出一個翻譯請求，失敗時回傳 None
+
+        source_texts 是這個請求要翻譯的原文，用來判斷模型輸出是否明顯無效。
+        """
+        payload = {
+            "model": self.model_name,
+            "messages": self.prompt.messages(user_content),
+            "stream": False,
+            "temperature": 0.1,  # 降低溫度以獲得更穩定的輸出
+            "keep_alive": self.keep_alive  # 只有 Ollama 原生 API 會用到
+        }
+        for attempt in range(self.max_retries + 1):
+            trace = {}
+            try:
+                content = await self.generate(payload, source_texts, trace)
+            except InvalidResponse as e:
+                # 模型沒有過載，不需要等待，直接重新生成
+                self.rejected += 1
+                self.record_request(trace, "invalid", attempt, len(source_texts), e)
+            except Exception as e:
+                self.record_request(trace, "error", attempt, len(source_texts), e)
+                if isinstance(e, OllamaError) and not e.retryable:
+                    return None
+                if attempt < self.max_retries:
+                    # full jitter：避免所有失敗的請求在同一時間一起重試
+                    delay = min(self.retry_backoff_max, self.retry_backoff * 2 ** attempt)
+                    await asyncio.sleep(random.uniform(0, delay))
+            else:
+                self.record_request(trace, "ok", attempt, len(source_texts))
+                return content
+        return None
+
+    def record_request(self, trace, outcome, attempt, cues, error=None):
+        if attempt == 0:
+            # 第一次送出前還在排程器佇列中等待了一段時間，之後的重試則是立即送出
+            trace["queue_wait"] = trace.get("queue_wait", 0.0) + _unit_wait.get()
+        if self.metrics is not None:
+            self.metrics.record_request(self, trace, outcome, attempt, cues, error)
+
+    async def generate(self, payload, source_texts, trace=None):
+        """取得一次模型輸出，輸出明顯無效時拋出 InvalidResponse
+
+        串流時一偵測到開場白、拒絕翻譯或長度失控就中止，接收中的譯文以 "partial" 事件回報。
+        """
+        if self.stream:
+            def on_delta(content):
+                reason = check_translation(content.strip(), source_texts)
+                if reason is None:
+                    self.report_partial(content)
+                return reason
+
+            content = await self.client.stream_chat_completion(payload, on_delta, trace)
+        else:
+            content = await self.client.chat_completion(payload, trace)
+        content = content.strip()
+        reason = check_translation(content, source_texts)
+        if reason is not None:
+            raise InvalidResponse(reason)
+        return content
+
+    def report_partial(self, content):
+        now = time.monotonic()
+        if now - self._partial_reported >= self.partial_interval:
+            self._partial_reported = now
+            self.progress_callback(self.reported, self.total, {"type": "partial", "path": self.file_path, "text": content})
+
+    async def keep_model_loaded(self):
+        """翻完一個檔案後延長模型的載入時間，下一個檔案不必重新載入模型"""
+        if self.keep_alive is None or not self.total:
+            return  # 跳過或空白的檔案沒有用到模型
+        try:
+            await self.client.keep_alive(self.model_name, self.keep_alive)
+        except Exception:
+            pass  # 只影響下一個檔案的載入速度
+
+    def complete_cues(self, results):
+        """記錄一組結果、套用譯文並回報進度，回傳這次新完成的句數"""
+        for index, result in results.items():
+            self.results[index] = result
+            for duplicate in self.duplicates.get(index, ()):
+                self.results[duplicate] = result
+            if result:
+                self.journal.record(index, result)
+            elif self.source_texts[index].strip():
+                self.untranslated.append(index)
+                self.untranslated.extend(self.duplicates.get(index, ()))
+        completed = self.reported
+        for index, result in self.results.items():
+            if self.finished[index]:
+                continue
+            self.finished[index] = 1
+            if result:
+                self.output_texts[index] = result
+            self.reported += 1
+        self.results = {}
+        if self.reported > completed:
+            self.progress_callback(self.reported, self.total, {"type": "progress", "path": self.file_path})
+        return self.reported - completed
+
+    def is_done(self):
+        return self.reported >= self.total
+
+    def finish(self):
+        """寫出輸出檔（先寫暫存檔再改名）並刪除進度日誌"""
+        output_path = self.output_path
+        if output_path:  # 只有在有效的輸出路徑時才保存
+            started = time.monotonic()
+            if self._first_request is not None:
+                self.timings["translate"] = started - self._first_request
+            self.run_cpu(write_cues, output_path, self.document, self.output_texts, self.output_encoding)
+            self.journal.remove()
+            self.timings["save"] = time.monotonic() - started
+            if self.metrics is not None:
+                self.metrics.record_file(self, self.timings)
+
+            message = f"翻譯完成 | 檔案已成功保存為: {output_path}"
+            notes = []
+            if self.document.encoding != "utf-8":
+                notes.append(f"原檔編碼 {self.document.encoding}")
+            if self.document.lossy:
+                notes.append("原檔有無法解碼的字元，已以 \ufffd 取代")
+            if self.resumed:
+                notes.append(f"從進度日誌接續 {self.resumed} 句")
+            if self.memory is not None:
+                notes.append(f"翻譯記憶命中 {self.cache_hits} 句")
+            duplicate_count = sum(len(indices) for indices in self.duplicates.values())
+            if duplicate_count:
+                notes.append(f"重複字幕 {duplicate_count} 句")
+            if self.rejected:
+                notes.append(f"中止無效輸出 {self.rejected} 次")
+            if self.untranslated:
+                numbers = [str(index + 1) for index in sorted(self.untranslated)]
+                listed = ", ".join(numbers[:20]) + (" ..." if len(numbers) > 20 else "")
+                notes.append(f"未翻譯 {len(numbers)} 句，保留原文：第 {listed} 句")
+            if notes:
+                message += f"（{'，'.join(notes)}）"
+            self.complete_callback(message)
+        else:
+            self.complete_callback(f"已跳過檔案: {self.file_path}")
+
+    async def fetch(self, text):
+        return await self.request_translation(self.prompt.single(text), [text])
+
+    @classmethod
+    def default_output_path(cls, file_path, target_lang):
+        """不考慮檔案衝突時的輸出路徑：原檔名加上目標語言的後綴"""
+        dir_name, file_name = os.path.split(file_path)
+        name, ext = os.path.splitext(file_name)
+        return os.path.join(dir_name, f"{name}{cls.LANG_SUFFIXES[target_lang]}{ext}")
+
+    def get_output_path(self):
+        # 獲取原始檔案的目錄和檔名
+        dir_name, file_name = os.path.split(self.file_path)
+        name, ext = os.path.splitext(file_name)
+        lang_suffix = self.LANG_SUFFIXES
+        # 在原始檔案的相同目錄下創建新檔案
+        base_path = self.default_output_path(self.file_path, self.target_lang)
+        
+        # 檢查檔案是否存在
+        if os.path.exists(base_path):
+            # 發送訊息到主線程處理檔案衝突
+            response = self.handle_file_conflict(base_path)
+            if response == "rename":
+                # 自動重新命名，加上數字後綴
+                counter = 1
+                while True:
+                    new_path = os.path.join(dir_name, f"{name}{lang_suffix[self.target_lang]}_{counter}{ext}")
+                    if not os.path.exists(new_path):
+                        return new_path
+                    counter += 1
+            elif response == "skip":
+                return None
+            # response == "overwrite" 則使用原始路徑
+        
+        return base_path
+
+    def handle_file_conflict(self, file_path):
+        if self.on_conflict is not None:
+            return self.on_conflict
+        # 使用 Queue 在線程間通信
+        queue = Queue()
+        # 請求主線程顯示對話框
+        self.progress_callback(-1, -1, {"type": "file_conflict", "path": file_path, "queue": queue})
+        # 等待使用者回應
+        return queue.get()
@@ -0,0 +1,74 @@
+import json
+import os
+
+JOURNAL_SUFFIX = ".journal"
+
+
+class TranslationJournal:
+    """翻譯進度日誌
+
+    每句字幕翻譯完成就附加一行到輸出檔旁的 .journal 檔，程式中途結束後
+    重新翻譯同一個檔案時，可以從日誌接續，只翻譯尚未完成的字幕。
+    signature 描述原始檔與翻譯設定，任何一項改變時舊日誌會被捨棄。
+    """
+
+    def __init__(self, output_path, signature):
+        self.path = output_path + JOURNAL_SUFFIX
+        self.signature = signature
+        self._file = None
+
+    def load(self):
+        """讀取可接續的譯文 {索引: 譯文}，日誌不存在或不相符時回傳空字典"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return {}
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return {}
+        if header.get("signature") != self.signature:
+            return {}
+
+        entries = {}
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # 中斷時寫到一半的最後一行
+            entries[entry["index"]] = entry["text"]
+        return entries
+
+    def open(self, resumed):
+        """開始記錄；resumed 為 False 時覆寫舊日誌"""
+        if resumed:
+            self._file = open(self.path, "a", encoding='utf-8')
+        else:
+            self._file = open(self.path, "w", encoding='utf-8')
+            self._write({"signature": self.signature})
+
+    def record(self, index, text):
+        self._write({"index": index, "text": text})
+
+    def remove(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+
+def file_signature(path, *settings):
+    """以檔案大小、修改時間與翻譯設定組成日誌簽章"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, *settings]
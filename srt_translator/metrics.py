@@ -0,0 +1,207 @@
+import collections
+import json
+import os
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".srt_translator", "metrics.jsonl")
+
+# 每個請求累計的數值欄位
+_COUNTERS = ("requests", "errors", "rejected", "retries", "cues", "cache_hits", "prompt_tokens", "completion_tokens")
+# 累計總和與次數的秒數欄位
+_TIMINGS = ("queue_wait", "latency", "ttft")
+
+
+def _new_stats():
+    return collections.Counter()
+
+
+class TranslationMetrics:
+    """翻譯請求的量測紀錄
+
+    翻譯工作每送出一個請求（含重試）就呼叫 record_request，記錄排隊等待送出的時間
+    （排程器佇列加連線池）、HTTP 延遲、首個 token 延遲、回應 usage 中的 token 數、
+    第幾次嘗試與結果；
+    翻譯記憶命中由 record_cache_hits 記錄，檔案完成時由 record_file 寫出整個檔案的彙總、
+    原檔編碼與各階段耗時（讀取、排隊、翻譯、存檔）。
+
+    數值依模型與檔案分別累計；有提供 log_path 時每筆紀錄以 JSON lines 附加到檔案中，
+    超過 max_log_bytes 時把舊檔改名為 .1 後重新開始。serve() 以 Prometheus 文字格式
+    在本機提供 /metrics。可安全地從多個執行緒使用。
+    """
+
+    def __init__(self, log_path=None, max_log_bytes=50 * 1024 * 1024):
+        self.log_path = log_path
+        self.max_log_bytes = max_log_bytes
+        self.models = collections.defaultdict(_new_stats)
+        self.files = collections.defaultdict(_new_stats)  # 只保留翻譯中的檔案，完成後寫入日誌並移除
+        self.outcomes = collections.Counter()  # (模型, 結果) -> 請求數
+        self.files_done = collections.Counter()  # 模型 -> 完成的檔案數
+        self.encodings = collections.Counter()  # 原檔編碼 -> 完成的檔案數
+
+        self._lock = threading.Lock()
+        self._log = None
+        self._server = None
+        if log_path:
+            os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+            if os.path.exists(log_path) and os.path.getsize(log_path) > max_log_bytes:
+                os.replace(log_path, log_path + ".1")
+            self._log = open(log_path, "a", encoding='utf-8')
+
+    def record_request(self, job, trace, outcome, attempt, cues, error=None):
+        """記錄一個請求，outcome 為 ok、invalid（輸出無效而中止）或 error"""
+        entry = {
+            "event": "request",
+            "file": job.file_path,
+            "model": job.model_name,
+            "backend": job.client.backend.name,
+            "attempt": attempt,
+            "outcome": outcome,
+            "cues": cues,
+        }
+        for name in _TIMINGS:
+            if trace.get(name) is not None:
+                entry[name] = round(trace[name], 4)
+        for name in ("prompt_tokens", "completion_tokens"):
+            if trace.get(name) is not None:
+                entry[name] = trace[name]
+        if error is not None:
+            entry["error"] = str(error)[:200]
+
+        with self._lock:
+            for stats in (self.models[job.model_name], self.files[job.file_path]):
+                stats["requests"] += 1
+                stats["errors"] += outcome == "error"
+                stats["rejected"] += outcome == "invalid"
+                stats["retries"] += attempt > 0
+                if outcome == "ok":
+                    stats["cues"] += cues
+                for name in ("prompt_tokens", "completion_tokens"):
+                    stats[name] += entry.get(name, 0)
+                for name in _TIMINGS:
+                    if name in trace and trace[name] is not None:
+                        stats[name + "_sum"] += trace[name]
+                        stats[name + "_count"] += 1
+            self.outcomes[job.model_name, outcome] += 1
+            self._write(entry)
+
+    def record_cache_hits(self, job, count):
+        """記錄翻譯記憶命中的字幕句數"""
+        with self._lock:
+            self.models[job.model_name]["cache_hits"] += count
+            self.files[job.file_path]["cache_hits"] += count
+
+    def record_file(self, job, timings):
+        """寫出一個檔案的彙總，timings 為各階段的秒數"""
+        with self._lock:
+            stats = self.files.pop(job.file_path, _new_stats())
+            self.files_done[job.model_name] += 1
+            self.encodings[job.document.encoding] += 1
+            entry = {
+                "event": "file",
+                "file": job.file_path,
+                "model": job.model_name,
+                "encoding": job.document.encoding,
+                "lossy_decode": job.document.lossy,
+                "total_cues": job.total,
+                "untranslated": len(job.untranslated),
+                **self._summarize(stats),
+                **{name: round(seconds, 4) for name, seconds in timings.items()},
+            }
+            self._write(entry)
+
+    def summary(self):
+        """回傳各模型的彙總 {模型: {...}}"""
+        with self._lock:
+            return {model: self._summarize(stats) for model, stats in self.models.items()}
+
+    def _summarize(self, stats):
+        result = {name: stats[name] for name in _COUNTERS}
+        for name in _TIMINGS:
+            count = stats[name + "_count"]
+            result[name + "_mean"] = round(stats[name + "_sum"] / count, 4) if count else None
+        return result
+
+    def _write(self, entry):
+        if self._log is None:
+            return
+        entry = {"time": round(time.time(), 3), **entry}
+        self._log.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._log.flush()
+
+    def prometheus_text(self):
+        """以 Prometheus 文字格式輸出目前的累計值"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP srt_translator_{name} {help_text}")
+            lines.append(f"# TYPE srt_translator_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+                lines.append(f"srt_translator_{name}{{{label_text}}} {value}")
+
+        with self._lock:
+            metric("requests_total", "counter", "翻譯請求數（含重試）",
+                   [({"model": model, "outcome": outcome}, count) for (model, outcome), count in self.outcomes.items()])
+            metric("files_total", "counter", "完成的檔案數",
+                   [({"model": model}, count) for model, count in self.files_done.items()])
+            metric("files_encoding_total", "counter", "依原檔編碼統計的完成檔案數",
+                   [({"encoding": encoding}, count) for encoding, count in self.encodings.items()])
+            for name, help_text in (("retries", "重試的請求數"), ("cues", "翻譯完成的字幕句數"),
+                                    ("cache_hits", "翻譯記憶命中的字幕句數"),
+                                    ("prompt_tokens", "輸入 token 數"), ("completion_tokens", "輸出 token 數")):
+                metric(f"{name}_total", "counter", help_text,
+                       [({"model": model}, stats[name]) for model, stats in self.models.items()])
+            for name, help_text in (("queue_wait", "排隊等待送出的秒數"), ("latency", "HTTP 請求秒數"), ("ttft", "首個 token 秒數")):
+                lines.append(f"# HELP srt_translator_{name}_seconds {help_text}")
+                lines.append(f"# TYPE srt_translator_{name}_seconds summary")
+                for model, stats in self.models.items():
+                    label = f'model="{_escape(model)}"'
+                    lines.append(f"srt_translator_{name}_seconds_sum{{{label}}} {stats[name + '_sum']:.6f}")
+                    lines.append(f"srt_translator_{name}_seconds_count{{{label}}} {stats[name + '_count']}")
+            # 翻譯中的檔案
+            metric("file_requests", "gauge", "翻譯中檔案已送出的請求數",
+                   [({"file": path}, stats["requests"]) for path, stats in self.files.items()])
+            metric("file_cues", "gauge", "翻譯中檔案已完成的字幕句數",
+                   [({"file": path}, stats["cues"] + stats["cache_hits"]) for path, stats in self.files.items()])
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """在背景執行緒中以 http://host:port/metrics 提供 Prometheus 文字格式"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # 用到時才載入
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,250 @@
+"""離線測試用的 Ollama 替身伺服器
+
+    python -m srt_translator.mock_server --port 11434 --latency 0.3 --tokens-per-second 40 --parallel 4 --error-rate 0.05
+
+提供 /v1/chat/completions（含 SSE 串流）、/api/chat 與 /api/generate（含 NDJSON 串流）、
+/v1/models 與 /api/tags，不需要 GPU 或模型就能測試排程與效能。
+每個請求先等待 latency 秒（模擬 prompt 處理），再以每秒 tokens_per_second 個字的速度輸出；
+同時最多處理 parallel 個請求，其餘排隊等候，與 OLLAMA_NUM_PARALLEL 的行為相同。
+error_rate 的比例的請求直接回傳 error_status。
+
+譯文為原文加上「譯:」前綴；批次請求（最後一行是 [{"id":..,"text":..}]）回覆同樣編號的 JSON 陣列。
+"""
+
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_PATHS = ("/v1/chat/completions", "/api/chat", "/api/generate")
+
+
+def fake_translation(user_content):
+    """依請求內容產生假譯文"""
+    last_line = user_content.strip().splitlines()[-1] if user_content.strip() else ""
+    try:
+        items = json.loads(last_line)
+    except ValueError:
+        items = None
+    if isinstance(items, list) and all(isinstance(item, dict) and "id" in item for item in items):
+        return json.dumps([{"id": item["id"], "text": f"譯:{item.get('text', '')}"} for item in items], ensure_ascii=False)
+    return f"譯:{last_line.strip(chr(39))}"
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 標頭與內容分兩次寫出，開著 Nagle 時每個非串流回應都會多等約 40 毫秒的延遲 ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        model = self.server.model
+        if self.path == "/v1/models":
+            self._send_json({"object": "list", "data": [{"id": model, "object": "model"}]})
+        elif self.path == "/api/tags":
+            self._send_json({"models": [{"name": model, "model": model}]})
+        else:
+            self._send_error(404, "not found")
+
+    def do_POST(self):
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            self._send_error(400, "invalid json")
+            return
+        if self.path not in CHAT_PATHS:
+            self._send_error(404, "not found")
+            return
+        if self.path == "/api/generate" and not payload.get("prompt"):
+            # 沒有 prompt 的 /api/generate 只是載入模型（keep_alive）
+            self.server.count("keep_alive")
+            self._send_json({"model": payload.get("model"), "response": "", "done": True})
+            return
+
+        server = self.server
+        server.count("requests")
+        if server.should_fail():
+            server.count("errors")
+            self._send_error(server.error_status, "mock overloaded")
+            return
+
+        if self.path == "/api/generate":
+            user_content = payload.get("prompt", "")
+        else:
+            user_content = payload["messages"][-1]["content"]
+        text = fake_translation(user_content)
+        self.prompt_tokens = len(user_content)  # 以字數當作 token 數
+
+        with server.slots:
+            server.enter()
+            try:
+                time.sleep(server.latency)
+                if payload.get("stream"):
+                    self._stream(text, payload)
+                else:
+                    time.sleep(len(text) / server.tokens_per_second)
+                    self._send_json(self._result(text, payload))
+            finally:
+                server.leave()
+
+    def _result(self, text, payload):
+        if self.path == "/v1/chat/completions":
+            return {
+                "object": "chat.completion",
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": self._usage(text),
+            }
+        counts = {"prompt_eval_count": self.prompt_tokens, "eval_count": len(text)}
+        if self.path == "/api/chat":
+            return {"model": payload.get("model"), "message": {"role": "assistant", "content": text}, "done": True, **counts}
+        return {"model": payload.get("model"), "response": text, "done": True, **counts}
+
+    def _usage(self, text):
+        return {"prompt_tokens": self.prompt_tokens, "completion_tokens": len(text),
+                "total_tokens": self.prompt_tokens + len(text)}
+
+    def _stream(self, text, payload):
+        openai = self.path == "/v1/chat/completions"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if openai else "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        # 每個片段至少 20 毫秒，避免高速設定時寫入次數過多
+        step = max(1, int(self.server.tokens_per_second * 0.02))
+        try:
+            for start in range(0, len(text), step):
+                piece = text[start:start + step]
+                time.sleep(len(piece) / self.server.tokens_per_second)
+                if openai:
+                    event = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+                    self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+                elif self.path == "/api/chat":
+                    self._write_chunk(json.dumps({"message": {"role": "assistant", "content": piece}, "done": False}, ensure_ascii=False) + "\n")
+                else:
+                    self._write_chunk(json.dumps({"response": piece, "done": False}, ensure_ascii=False) + "\n")
+            if openai:
+                if (payload.get("stream_options") or {}).get("include_usage"):
+                    event = {"choices": [], "usage": self._usage(text)}
+                    self._write_chunk(f"data: {json.dumps(event)}\n\n")
+                self._write_chunk("data: [DONE]\n\n")
+            else:
+                final = self._result("", payload)
+                final["eval_count"] = len(text)
+                self._write_chunk(json.dumps(final) + "\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 用戶端中止串流
+            self.server.count("aborted")
+            self.close_connection = True
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, result):
+        body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        body = json.dumps({"error": message}).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockOllamaServer(ThreadingHTTPServer):
+    """可設定延遲、輸出速度、並行數與錯誤率的替身伺服器，stats 記錄請求統計"""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, tokens_per_second=200.0, parallel=4,
+                 error_rate=0.0, error_status=503, model="mock", seed=None):
+        super().__init__((host, port), MockRequestHandler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.slots = threading.BoundedSemaphore(parallel)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.model = model
+        self.stats = collections.Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """在背景執行緒中開始服務，回傳自己"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def enter(self):
+        with self._lock:
+            self._active += 1
+            self.stats["max_active"] = max(self.stats["max_active"], self._active)
+
+    def leave(self):
+        with self._lock:
+            self._active -= 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m srt_translator.mock_server", description="離線測試用的 Ollama 替身伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.05, help="每個請求開始輸出前的等待秒數")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="每個請求每秒輸出的字數")
+    parser.add_argument("--parallel", type=int, default=4, help="同時處理的請求數，其餘排隊")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="直接回傳錯誤的請求比例（0～1）")
+    parser.add_argument("--error-status", type=int, default=503, help="注入錯誤時回傳的 HTTP 狀態碼")
+    parser.add_argument("--model", default="mock", help="/v1/models 回報的模型名稱")
+    parser.add_argument("--seed", type=int, help="錯誤注入的亂數種子")
+    args = parser.parse_args(argv)
+
+    server = MockOllamaServer(args.host, args.port, args.latency, args.tokens_per_second, args.parallel,
+                              args.error_rate, args.error_status, args.model, args.seed)
+    print(f"替身伺服器已啟動: {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(dict(server.stats)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import json
+import os
+import threading
+
+from .ollama_client import DEFAULT_BASE_URL, OllamaClient
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".srt_translator", "models.json")
+DEFAULT_TIMEOUT = 5  # 查詢模型列表的逾時秒數，Ollama 沒有回應時不會讓介面等太久
+
+
+def load_cached_models(path=DEFAULT_CACHE_PATH):
+    """讀取上次成功取得的模型列表，沒有或無法讀取時回傳空列表"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            models = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return [model for model in models if isinstance(model, str)] if isinstance(models, list) else []
+
+
+def save_cached_models(models, path=DEFAULT_CACHE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding='utf-8') as f:
+        json.dump(models, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def fetch_models(base_url=DEFAULT_BASE_URL, timeout=DEFAULT_TIMEOUT, cache_path=DEFAULT_CACHE_PATH):
+    """向 Ollama 查詢模型列表，取得後寫入快取"""
+    client = OllamaClient(base_url, pool_size=1, timeout=timeout)
+    try:
+        models = client.list_models()
+    finally:
+        client.close()
+    if models and cache_path:
+        try:
+            save_cached_models(models, cache_path)
+        except OSError:
+            pass  # 快取只影響下次啟動時的預設選項
+    return models
+
+
+def refresh_models(callback, base_url=DEFAULT_BASE_URL, timeout=DEFAULT_TIMEOUT, cache_path=DEFAULT_CACHE_PATH):
+    """在背景執行緒中查詢模型列表，完成後呼叫 callback(模型列表, 錯誤)
+
+    callback 在背景執行緒中呼叫，介面程式應把結果交給介面執行緒（例如 UiEventQueue.post）。
+    查詢失敗時模型列表為 None。
+    """
+    def run():
+        try:
+            models = fetch_models(base_url, timeout, cache_path)
+        except Exception as e:
+            callback(None, e)
+        else:
+            callback(models, None)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
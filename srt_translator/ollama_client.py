@@ -0,0 +1,394 @@
+import asyncio
+import http.client
+import json
+import queue
+import threading
+import time
+import urllib.parse
+
+from .backends import OpenAIChatBackend
+from .errors import InvalidResponse, OllamaError
+
+DEFAULT_BASE_URL = "http://localhost:11434"
+
+
+class OllamaClient:
+    """共用連線池的 Ollama HTTP 客戶端
+
+    連線使用 HTTP keep-alive，請求結束後放回池中給下一個請求沿用，
+    不必每句字幕都重新建立 TCP 連線。同時最多 pool_size 條連線，
+    timeout 同時作用於連線與讀取。可安全地從多個執行緒同時呼叫。
+    backend 決定翻譯請求使用的 API（見 backends.BACKENDS），預設為 OpenAI 相容端點。
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, pool_size=5, timeout=120, backend=None):
+        parts = urllib.parse.urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path_prefix = parts.path.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.backend = backend or OpenAIChatBackend()
+
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._idle = queue.LifoQueue()
+
+    def chat_completion(self, payload):
+        """送出一個對話請求，回傳模型輸出的文字"""
+        result = self.request_json("POST", self.backend.path, self.backend.request_body(payload, stream=False))
+        return self.backend.parse_response(result)[0]
+
+    def list_models(self):
+        """呼叫 /v1/models，回傳模型名稱列表"""
+        models = self.request_json("GET", "/v1/models")
+        if 'data' in models and isinstance(models['data'], list):
+            return [model['id'] for model in models['data']]
+        return []
+
+    def request_json(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        with self._slots:
+            conn, reused = self._checkout()
+            try:
+                response, data = self._send(conn, method, path, body, headers)
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                if not reused:
+                    raise
+                # 閒置的連線可能已被伺服器關閉，換一條新連線重試一次
+                conn = self._new_connection()
+                try:
+                    response, data = self._send(conn, method, path, body, headers)
+                except Exception:
+                    conn.close()
+                    raise
+            except Exception:
+                conn.close()
+                raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+        if response.status >= 400:
+            raise OllamaError(f"HTTP {response.status}: {data[:200].decode('utf-8', 'replace')}", response.status)
+        try:
+            return json.loads(data.decode('utf-8'))
+        except ValueError:
+            raise OllamaError(f"無法解析的回應: {data[:200]!r}")
+
+    def close(self):
+        """關閉所有閒置連線"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _send(self, conn, method, path, body, headers):
+        conn.request(method, self.path_prefix + path, body=body, headers=headers)
+        response = conn.getresponse()
+        return response, response.read()
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _new_connection(self):
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+
+class AsyncOllamaClient:
+    """asyncio 版的連線池 Ollama 客戶端
+
+    直接在事件迴圈上以非阻塞 socket 收發 HTTP/1.1，不占用任何執行緒；
+    keep-alive 連線放回池中沿用，同時最多 pool_size 條連線（BoundedSemaphore）。
+    同一個實例只能在同一個事件迴圈中使用。
+
+    observer（例如 AdaptiveConcurrency）會收到每個翻譯請求的結果：
+    成功時呼叫 record(送出時間, 產生的 token 數)，可重試的失敗時呼叫 record_error(送出時間)。
+    backend 決定翻譯請求使用的 API（見 backends.BACKENDS），預設為 OpenAI 相容端點。
+
+    翻譯請求可傳入 trace（dict），請求結束時（不論成功與否）會填入：
+      queue_wait         等待連線池空位的秒數
+      latency            取得空位後到收完回應的秒數
+      ttft               串流時收到第一段輸出的秒數
+      prompt_tokens / completion_tokens  回應 usage 中的 token 數，伺服器沒提供時為 None
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, pool_size=5, timeout=120, observer=None, backend=None):
+        parts = urllib.parse.urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.path_prefix = parts.path.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.observer = observer
+        self.backend = backend or OpenAIChatBackend()
+
+        self._slots = asyncio.BoundedSemaphore(pool_size)
+        self._idle = []  # (reader, writer)
+
+    async def chat_completion(self, payload, trace=None):
+        """送出一個對話請求，回傳模型輸出的文字"""
+        observer = self.observer
+        started = time.monotonic()
+        trace = {} if trace is None else trace
+        try:
+            result = await self.request_json("POST", self.backend.path, self.backend.request_body(payload, stream=False), trace)
+            content, usage = self.backend.parse_response(result)
+        except Exception as e:
+            if observer is not None and (not isinstance(e, OllamaError) or e.retryable):
+                observer.record_error(started)
+            raise
+        trace.update(usage)
+        if observer is not None:
+            observer.record(started, usage["completion_tokens"] or len(content))
+        return content
+
+    async def stream_chat_completion(self, payload, on_delta=None, trace=None):
+        """以串流方式送出一個對話請求，回傳模型輸出的文字
+
+        每收到一段輸出就呼叫 on_delta(目前為止的全文)；on_delta 回傳中止原因時
+        立即關閉連線讓 Ollama 停止生成，並拋出 InvalidResponse。
+        """
+        body = json.dumps(self.backend.request_body(payload, stream=True)).encode('utf-8')
+        observer = self.observer
+        started = time.monotonic()
+        trace = {} if trace is None else trace
+        try:
+            async with self._slots:
+                acquired = time.monotonic()
+                trace["queue_wait"] = acquired - started
+                try:
+                    content, parts, usage = await asyncio.wait_for(self._stream(body, on_delta, trace, acquired), self.timeout)
+                finally:
+                    trace["latency"] = time.monotonic() - acquired
+        except InvalidResponse:
+            raise
+        except Exception as e:
+            if observer is not None and (not isinstance(e, OllamaError) or e.retryable):
+                observer.record_error(started)
+            raise
+        trace.update(usage or {"prompt_tokens": None, "completion_tokens": None})
+        if observer is not None:
+            # 沒有 usage 時以串流片段數代替，每個片段就是一個 token
+            observer.record(started, trace["completion_tokens"] or parts)
+        return content
+
+    async def keep_alive(self, model, duration):
+        """透過 /api/generate 載入模型並設定閒置多久後卸載（OpenAI 相容端點不接受 keep_alive）"""
+        await self.request_json("POST", "/api/generate", {"model": model, "keep_alive": duration})
+
+    async def list_models(self):
+        """呼叫 /v1/models，回傳模型名稱列表"""
+        models = await self.request_json("GET", "/v1/models")
+        if 'data' in models and isinstance(models['data'], list):
+            return [model['id'] for model in models['data']]
+        return []
+
+    async def request_json(self, method, path, payload=None, trace=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b""
+        started = time.monotonic()
+        async with self._slots:
+            acquired = time.monotonic()
+            if trace is not None:
+                trace["queue_wait"] = acquired - started
+            try:
+                status, data = await self._request(method, path, body)
+            finally:
+                if trace is not None:
+                    trace["latency"] = time.monotonic() - acquired
+
+        if status >= 400:
+            raise OllamaError(f"HTTP {status}: {data[:200].decode('utf-8', 'replace')}", status)
+        try:
+            return json.loads(data.decode('utf-8'))
+        except ValueError:
+            raise OllamaError(f"無法解析的回應: {data[:200]!r}")
+
+    async def close(self):
+        """關閉所有閒置連線"""
+        while self._idle:
+            self._discard(self._idle.pop())
+
+    async def _request(self, method, path, body):
+        conn, reused = await self._checkout()
+        try:
+            status, data, keep_alive = await asyncio.wait_for(self._send(conn, method, path, body), self.timeout)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self._discard(conn)
+            if not reused:
+                raise
+            # 閒置的連線可能已被伺服器關閉，換一條新連線重試一次
+            conn = await self._new_connection()
+            try:
+                status, data, keep_alive = await asyncio.wait_for(self._send(conn, method, path, body), self.timeout)
+            except BaseException:
+                self._discard(conn)
+                raise
+        except BaseException:
+            self._discard(conn)
+            raise
+
+        if keep_alive:
+            self._idle.append(conn)
+        else:
+            self._discard(conn)
+        return status, data
+
+    async def _stream(self, body, on_delta, trace, started):
+        """回傳 (全文, 文字片段數, token 用量)"""
+        conn, reused = await self._checkout()
+        try:
+            try:
+                status, headers, keep_alive = await self._send_head(conn, "POST", self.backend.path, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                # 閒置的連線可能已被伺服器關閉，換一條新連線重試一次
+                self._discard(conn)
+                conn = await self._new_connection()
+                status, headers, keep_alive = await self._send_head(conn, "POST", self.backend.path, body)
+
+            if status >= 400:
+                data = b"".join([chunk async for chunk in self._iter_body(conn[0], headers)])
+                raise OllamaError(f"HTTP {status}: {data[:200].decode('utf-8', 'replace')}", status)
+
+            if headers.get("content-type", "").startswith("application/json"):
+                # 不支援串流的伺服器會直接回傳完整結果
+                data = b"".join([chunk async for chunk in self._iter_body(conn[0], headers)])
+                try:
+                    result = json.loads(data.decode('utf-8'))
+                except ValueError:
+                    raise OllamaError(f"無法解析的回應: {data[:200]!r}")
+                content, usage = self.backend.parse_response(result)
+                parts = [content]
+                trace["ttft"] = time.monotonic() - started
+                reason = on_delta(content) if on_delta is not None else None
+                if reason:
+                    raise InvalidResponse(reason)
+            else:
+                parts, usage = await self._read_events(conn[0], headers, on_delta, trace, started)
+        except BaseException:
+            self._discard(conn)
+            raise
+
+        if keep_alive:
+            self._idle.append(conn)
+        else:
+            self._discard(conn)
+        return "".join(parts), len(parts), usage
+
+    async def _read_events(self, reader, headers, on_delta, trace, started):
+        """逐行讀取串流回應（SSE 或 NDJSON，由 backend 解析），回傳 (收到的文字片段, token 用量)"""
+        parts = []
+        usage = None
+        buffer = b""
+        chunks = self._iter_body(reader, headers)
+        try:
+            async for chunk in chunks:
+                *lines, buffer = (buffer + chunk).split(b"\n")
+                for line in lines:
+                    delta, line_usage = self.backend.parse_stream_line(line)
+                    usage = line_usage or usage
+                    if not delta:
+                        continue
+                    if not parts:
+                        trace["ttft"] = time.monotonic() - started
+                    parts.append(delta)
+                    if on_delta is not None:
+                        reason = on_delta("".join(parts))
+                        if reason:
+                            raise InvalidResponse(reason)
+        finally:
+            await chunks.aclose()
+        # NDJSON 的最後一行可能沒有換行
+        if buffer.strip():
+            delta, line_usage = self.backend.parse_stream_line(buffer)
+            usage = line_usage or usage
+            if delta:
+                parts.append(delta)
+        return parts, usage
+
+    async def _send(self, conn, method, path, body):
+        status, headers, keep_alive = await self._send_head(conn, method, path, body)
+        data = b"".join([chunk async for chunk in self._iter_body(conn[0], headers)])
+        return status, data, keep_alive
+
+    async def _send_head(self, conn, method, path, body):
+        """送出請求並讀取狀態列與標頭，回傳 (狀態碼, 標頭, 是否可沿用連線)"""
+        reader, writer = conn
+        head = (
+            f"{method} {self.path_prefix}{path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("連線已被伺服器關閉")
+        version, status = status_line.split(None, 2)[:2]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        # 沒有 chunked 或 Content-Length 的回應要讀到連線關閉為止，之後不能再沿用
+        keep_alive = (version == b"HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                      and ("content-length" in headers or headers.get("transfer-encoding", "").lower() == "chunked"))
+        return int(status), headers, keep_alive
+
+    async def _iter_body(self, reader, headers):
+        """逐段讀取回應本文，支援 chunked、Content-Length 與讀到連線關閉為止三種形式"""
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # 略過 trailer
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return
+                yield await reader.readexactly(size)
+                await reader.readexactly(2)
+        elif "content-length" in headers:
+            yield await reader.readexactly(int(headers["content-length"]))
+        else:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    return
+                yield chunk
+
+    async def _checkout(self):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return (reader, writer), True
+            writer.close()
+        return await self._new_connection(), False
+
+    async def _new_connection(self):
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self.scheme == "https"),
+            self.timeout,
+        )
+
+    def _discard(self, conn):
+        conn[1].close()
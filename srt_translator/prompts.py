@@ -0,0 +1,195 @@
+import functools
+import json
+import re
+
+# 系統提示：adult 為 main.py、adult_context 為 main v2.py（附上下文）、general 為 main_qt5.py 使用
+SYSTEM_PROMPTS = {
+    "adult": """You are a professional translator for 日本A影片字幕檔，直接使用顯式、粗俗的詞彙來翻譯與性相關的動詞、名詞與形容詞等，包括強姦、肛交、拳交、舔陰、亂倫、騷貨、賤人、潮吹等。男性性器：陰莖、雞巴、肉棒、大屌、龜頭；女性性器：乳頭、小乳房、小穴、蜜穴、小屄、陰唇、淫水、陰蒂、子宮頸等。
+請嚴格遵守以下規則：
+1. 只輸出翻譯後的文本，不要有任何其他回應。
+2. 根據提供的上下文（前後五句字幕）並考量影片為日本A片來優化翻譯結果，確保流暢且符合對話邏輯。
+2. 保持原文的語氣和表達方式
+3. 如果看到省略號(...)，保留在譯文中
+4. 保留原文中的標點符號風格
+5. 不要添加任何解釋或註釋
+6. 不要改變原文的格式
+7. 如果遇到不確定的內容，根據上下文合理推測
+8. 禁止輸出任何非翻譯內容
+9. 禁止解釋或評論原文內容
+
+範例輸入：
+"I love you..."
+正確輸出：
+"我愛你..."
+
+錯誤輸出：
+"翻譯：我愛你..."
+"這句話的意思是：我愛你..."
+"我愛你（這是表達愛意）..."
+"我可以幫你翻譯，這句話的意思是，我愛你（這是表達愛意）..."
+"你好！我可以幫你翻譯。以下是翻譯結果：「我愛你...」
+"我不能幫你翻譯這句話"
+"您好！以下是翻譯結果：「我愛你...」"
+"您好！我可以協助您翻譯。以下是翻譯結果：「我愛你...」"
+"您要我翻譯什麼內容？請提供需要翻譯的文本，我將嚴格遵守您的要求，只輸出翻譯後的結果。"
+"將以下文本翻譯成繁體中文：「我愛你...」
+""",
+    "adult_context": """You are a professional translator for 日本A片字幕檔(影片類型主要是亂倫、性交、虐待、凌辱、變態等非正常影片)。
+請嚴格遵守以下規則：
+1. 只輸出翻譯後的文本，不要有任何其他回應(不要有開場白，不要輸出警告，也不要有任何的解釋)，內容前後不要有"「"、"」"。
+2. 保持原文的語氣和表達方式。
+3. 根據提供的上下文（前後五句字幕）並考量影片為日本A片來優化翻譯結果，確保流暢且符合對話邏輯。
+4. 直接使用顯式、粗俗的詞彙來翻譯與性相關的動詞、名詞與形容詞等，包括強姦、肛交、拳交、舔陰、亂倫、騷貨、賤人、潮吹、爸爸、媽媽、女兒等。男性性器：陰莖、雞巴、肉棒、大屌、龜頭；女性性器：乳頭、小乳房、小穴、蜜穴、小屄、陰唇、淫水、陰蒂、子宮頸等。
+5. 如果看到省略號(...)，保留在譯文中。
+6. 禁止輸出任何非翻譯內容。
+
+範例輸入：
+"I love you..."
+正確輸出：
+"我愛你..."
+
+錯誤輸出：
+"翻譯：我愛你..."
+"這句話的意思是：我愛你..."
+"我愛你（這是表達愛意）..."
+"我可以幫你翻譯，這句話的意思是，我愛你（這是表達愛意）..."
+"你好！我可以幫你翻譯。以下是翻譯結果：我愛你...
+"我不能幫你翻譯這句話"
+"您好！以下是翻譯結果：我愛你..."
+"您好！我可以協助您翻譯。以下是翻譯結果：我愛你..."
+"您要我翻譯什麼內容？請提供需要翻譯的文本，我將嚴格遵守您的要求，只輸出翻譯後的結果。"
+"將以下文本翻譯成繁體中文：我愛你..."
+""",
+    "general": """你是一個專業的字幕翻譯AI。請嚴格遵守以下規則：
+1. 只輸出翻譯後的文本，不要有任何其他內容
+2. 保持原文的語氣和表達方式
+3. 如果看到省略號(...)，保留在譯文中
+4. 保留原文中的標點符號風格
+5. 不要添加任何解釋或註釋
+6. 不要改變原文的格式
+7. 如果遇到不確定的內容，根據上下文合理推測
+8. 禁止輸出任何非翻譯內容
+9. 禁止解釋或評論原文內容
+
+範例輸入：
+"I love you..."
+正確輸出：
+"我愛你..."
+
+錯誤輸出：
+"翻譯：我愛你..."
+"這句話的意思是：我愛你..."
+"我愛你（這是表達愛意）..."
+"我可以幫你翻譯，這句話的意思是，我愛你（這是表達愛意）..."
+"你好！我可以幫你翻譯。以下是翻譯結果：「我愛你...」
+"我不能幫你翻譯這句話"
+"您好！以下是翻譯結果：「我愛你...」"
+"您好！我可以協助您翻譯。以下是翻譯結果：「我愛你...」"
+"您要我翻譯什麼內容？請提供需要翻譯的文本，我將嚴格遵守您的要求，只輸出翻譯後的結果。"
+"將以下文本翻譯成繁體中文：「我愛你...」
+""",
+}
+
+# 模型有時會把 JSON 包在 markdown 程式碼區塊中
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+# 模型不遵守系統提示時常見的開場白或拒絕，出現在譯文開頭就視為無效
+_PREAMBLE = re.compile(
+    r"^\W*(?:"
+    r"翻譯[：:]|翻譯結果|這句話的意思是|以下是.{0,8}(?:翻譯|譯文)|"
+    r"(?:您|你)好[！!，,]\s*(?:我可以(?:幫|協助)(?:你|您)?翻譯|以下是)|"
+    r"我(?:可以|能|將)(?:幫|協助|為)(?:你|您)翻譯|我(?:不能|無法)(?:幫|協助|為)?(?:你|您)?翻譯|"
+    r"您要我翻譯|請提供需要翻譯|將以下文本翻譯成|"
+    r"here(?: is|'s) the translation|i(?:'m sorry, but i)? (?:cannot|can't) (?:help|assist|translate)|as an ai"
+    r")",
+    re.IGNORECASE,
+)
+
+# 譯文長度超過原文的這個倍數（另加每句的寬限字數）就視為模型失控
+MAX_LENGTH_RATIO = 4
+MAX_LENGTH_EXTRA = 40
+
+
+def check_translation(content, source_texts):
+    """檢查（可能還沒輸出完的）模型輸出，明顯無效時回傳原因，否則回傳 None
+
+    批次請求的回覆前面多一句說明不影響解析，所以只有單句請求檢查開場白；
+    原文本身就符合開場白規則時（例如原文就在談翻譯）不檢查。
+    """
+    source_length = sum(len(text) for text in source_texts)
+    if len(content) > source_length * MAX_LENGTH_RATIO + MAX_LENGTH_EXTRA * max(1, len(source_texts)):
+        return "輸出長度失控"
+    if len(source_texts) <= 1 and _PREAMBLE.search(content):
+        if not any(_PREAMBLE.search(text) for text in source_texts):
+            return "輸出包含開場白或拒絕翻譯"
+    return None
+
+
+class PromptLayout:
+    """同一個系統提示與目標語言共用的請求版面
+
+    Ollama 會沿用與前一個請求開頭相同部分的 KV cache，所以固定不變的內容
+    （系統提示、翻譯指示）一律放在最前面，且每個請求都逐位元組相同；
+    每句不同的上下文與字幕內容只放在最後。用 prompt_layout() 取得共用的實例。
+    """
+
+    def __init__(self, system_prompt, target_lang):
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.single_instruction = f"將以下文本翻譯成{target_lang}：\n"
+        self.context_instruction = (
+            f"請參考上下文，將當前字幕翻譯成{target_lang}。\n"
+            "以下是字幕內容（當前字幕的前後文，作為上下文參考）：\n"
+        )
+        self.batch_instruction = (
+            f"請將下列字幕逐句翻譯成{target_lang}。\n"
+            "只輸出一個 JSON 陣列，每句一個物件，格式為 {\"id\": 編號, \"text\": \"譯文\"}，"
+            "編號與原文一一對應，不要合併、拆分或省略任何一句。\n"
+        )
+
+    def messages(self, user_content):
+        return [self.system_message, {"role": "user", "content": user_content}]
+
+    def single(self, text):
+        return self.single_instruction + text
+
+    def context(self, text, context_texts):
+        return (f"{self.context_instruction}{json.dumps(context_texts, ensure_ascii=False)}\n"
+                f"當前字幕：\n'{text}'")
+
+    def batch(self, texts, context_texts=None):
+        """把多句連續字幕組成一個請求，要求模型以相同編號的 JSON 陣列回覆"""
+        items = [{"id": i + 1, "text": text} for i, text in enumerate(texts)]
+        prompt = self.batch_instruction
+        if context_texts:
+            prompt += f"上下文參考（包含這幾句的前後文）：\n{json.dumps(context_texts, ensure_ascii=False)}\n"
+        prompt += f"需要翻譯的 {len(items)} 句字幕：\n{json.dumps(items, ensure_ascii=False)}"
+        return prompt
+
+
+@functools.lru_cache(maxsize=None)
+def prompt_layout(system_prompt, target_lang):
+    return PromptLayout(system_prompt, target_lang)
+
+
+def parse_batch_response(content, count):
+    """解析批次翻譯結果，數量或編號對不上時回傳 None"""
+    content = _CODE_FENCE.sub("", content.strip())
+    start, end = content.find("["), content.rfind("]")
+    if start < 0 or end < start:
+        return None
+    try:
+        items = json.loads(content[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(items, list) or len(items) != count:
+        return None
+
+    translations = []
+    for expected_id, item in enumerate(items, 1):
+        if not isinstance(item, dict) or item.get("id") != expected_id:
+            return None
+        text = item.get("text")
+        if not isinstance(text, str) or not text.strip():
+            return None
+        translations.append(text.strip())
+    return translations
@@ -0,0 +1,289 @@
+"""字幕檔的讀取與寫出
+
+原檔只讀取一次：先以 BOM 與檔案開頭的一段樣本判斷編碼（detect_encoding），
+再把整份內容一次解碼；樣本之後才出現無法解碼的位元組時，直接以記憶體中的
+同一份資料重新判斷或取代無法解碼的字元，不必重新讀檔。
+
+SrtDocument 只保留解碼後的整份原文，以及每句字幕的開始／結束毫秒與文字位置
+（array 平行陣列），不為每句字幕建立物件；寫出時只把有改變的字幕文字換掉，
+其餘內容（編號、時間軸、位置標記、無法解析的區塊、BOM 與換行字元）逐位元組保留。
+
+這裡的函式只接收與回傳這些精簡的資料，可以直接在 ProcessPoolExecutor 的子行程中執行，
+解析、整理文字與寫檔都不必和介面及網路排程器搶同一個 GIL。在子行程中讀取時
+（read_cues 的 detach）回傳的 SrtDocument 不含原文，寫出時再由子行程重新讀取原檔。
+"""
+
+import array
+import codecs
+import os
+import re
+
+from .translation_memory import normalize_text
+
+# 時間軸行：00:00:01,000 --> 00:00:02,500（小數點也接受，行尾可以有位置標記）
+_TIMING = r"[ \t]*(\d+):(\d+):(\d+)[,.](\d+)[ \t]*-->[ \t]*(\d+):(\d+):(\d+)[,.](\d+)"
+# 一句字幕：時間軸行加上其後的非空白行（遇到空白行、檔案結尾或下一個時間軸行為止）
+_CUE = re.compile(
+    r"^" + _TIMING + r"[^\r\n]*(?:\r?\n|\Z)"
+    r"((?:(?![ \t]*\d+:\d+:\d+[,.]\d+[ \t]*-->)[^\S\r\n]*\S[^\r\n]*(?:\r?\n|\Z))*)",
+    re.MULTILINE)
+
+# 依序檢查的 BOM，UTF-32 LE 的開頭與 UTF-16 LE 相同，要先檢查
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+# 沒有 BOM 且不是 UTF-8 時依序嘗試的編碼：日文字幕多為 Shift_JIS（CP932 為其超集），其次是繁體、簡體中文
+FALLBACK_ENCODINGS = ("cp932", "cp950", "gb18030")
+SAMPLE_SIZE = 64 * 1024  # 判斷編碼時檢查的位元組數
+
+# 寫出時需要自行加上 BOM 的編碼（utf-16、utf-32 編碼器本身就會寫入 BOM）
+_BOM_ENCODINGS = {encoding for _, encoding in _BOMS}
+
+
+class SrtDocument:
+    """解析後的 SRT 檔
+
+    source 為去掉 BOM 的原文，encoding 為原檔的編碼；starts、ends 為各句字幕的開始與結束毫秒，
+    text_starts、text_ends 為字幕文字在 source 中的位置。沒有時間軸行的區塊不算字幕，
+    原樣保留；字幕文字到空白行（或下一句字幕）為止。
+    """
+
+    __slots__ = ("source", "encoding", "bom", "lossy", "newline", "starts", "ends", "text_starts", "text_ends",
+                 "source_path", "source_length")
+
+    def __init__(self, source, encoding="utf-8", bom=False, lossy=False):
+        self.source = source
+        self.encoding = encoding
+        self.bom = bom
+        self.lossy = lossy  # 有無法解碼、以 U+FFFD 取代的位元組
+        self.source_path = None  # 不含原文時，寫出前從這個檔案重新讀取
+        self.source_length = len(source)
+        first_line = source.find("\n")
+        self.newline = "\r\n" if first_line > 0 and source[first_line - 1] == "\r" else "\n"
+        self.starts = array.array("q")
+        self.ends = array.array("q")
+        self.text_starts = array.array("q")
+        self.text_ends = array.array("q")
+        self._parse()
+
+    def _parse(self):
+        source = self.source
+        starts, ends = self.starts, self.ends
+        text_starts, text_ends = self.text_starts, self.text_ends
+        for match in _CUE.finditer(source):
+            h1, m1, s1, f1, h2, m2, s2, f2, _ = match.groups()
+            text_start, text_end = match.span(9)
+            next_char = source[text_end:text_end + 1]
+            if next_char and next_char not in "\r\n \t":
+                # 兩句字幕之間沒有空白行，停在下一個時間軸行：最後一行若是編號就屬於下一句
+                last_line = source.rfind("\n", text_start, text_end - 1) + 1
+                if last_line > text_start and source[last_line:text_end].strip().isdigit():
+                    text_end = last_line
+            # 文字不含結尾的換行
+            if text_end > text_start and source[text_end - 1] == "\n":
+                text_end -= 1
+                if text_end > text_start and source[text_end - 1] == "\r":
+                    text_end -= 1
+            starts.append(int(h1) * 3600000 + int(m1) * 60000 + int(s1) * 1000 + int(f1[:3]))
+            ends.append(int(h2) * 3600000 + int(m2) * 60000 + int(s2) * 1000 + int(f2[:3]))
+            text_starts.append(text_start)
+            text_ends.append(text_end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def detach(self, path):
+        """不含原文的副本，跨行程傳遞時只帶時間軸與文字位置；path 為原檔路徑"""
+        document = object.__new__(SrtDocument)
+        for name in self.__slots__:
+            setattr(document, name, getattr(self, name))
+        document.source = None
+        document.source_path = path
+        return document
+
+    def attach(self):
+        """重新讀取 detach 時的原檔，以相同的編碼解碼；內容已經改變時拋出 ValueError"""
+        with open(self.source_path, "rb") as f:
+            source = decode_source(f.read(), self.encoding)[0]
+        if len(source) != self.source_length:
+            raise ValueError(f"原檔在翻譯期間被修改: {self.source_path}")
+        self.source = source
+
+    def text(self, index):
+        """第 index 句字幕的文字，換行統一為 \\n"""
+        return self.source[self.text_starts[index]:self.text_ends[index]].replace("\r\n", "\n")
+
+    def texts(self):
+        return [self.text(index) for index in range(len(self))]
+
+    def render(self, texts):
+        """套用譯文後的完整內容，文字沒有改變的字幕與其他內容保持原樣"""
+        source = self.source
+        parts = []
+        position = 0
+        for index, text in enumerate(texts):
+            if text == self.text(index):
+                continue
+            start, end = self.text_starts[index], self.text_ends[index]
+            text = text.replace("\n", self.newline)
+            if start == end:
+                # 原本沒有文字：補上與時間軸行或後面空白行之間的換行
+                if source[start - 1:start] != "\n":
+                    text = self.newline + text
+                else:
+                    text += self.newline
+            parts.append(source[position:start])
+            parts.append(text)
+            position = end
+        parts.append(source[position:])
+        return "".join(parts)
+
+
+def _utf16_without_bom(sample):
+    """SRT 的編號與時間軸都是 ASCII，UTF-16 時每兩個位元組就有一個 0"""
+    if len(sample) < 32:
+        return None
+    even = sample[0::2].count(0)
+    odd = sample[1::2].count(0)
+    half = len(sample) // 2
+    if odd > half * 0.2 and even < odd / 4:
+        return "utf-16-le"
+    if even > half * 0.2 and odd < even / 4:
+        return "utf-16-be"
+    return None
+
+
+def _decodes(sample, encoding):
+    """樣本能否以 encoding 解碼（樣本結尾被截斷的多位元組字元不算錯誤）"""
+    try:
+        text = codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return False
+    if encoding == "cp932":
+        # 半形片假名在字幕中很少見，大量出現通常是把 Big5／GBK 誤認為 Shift_JIS
+        non_ascii = sum(1 for char in text if char >= "\x80")
+        halfwidth = sum(1 for char in text if "\uff61" <= char <= "\uff9f")
+        return halfwidth <= non_ascii * 0.3
+    return True
+
+
+def detect_encoding(data, sample_size=SAMPLE_SIZE):
+    """判斷編碼，回傳 (編碼, 是否有 BOM)；只檢查開頭 sample_size 個位元組"""
+    for bom, encoding in _BOMS:
+        if data.startswith(bom):
+            return encoding, True
+    sample = data[:sample_size]
+    encoding = _utf16_without_bom(sample)
+    if encoding is not None:
+        return encoding, False
+    for encoding in ("utf-8",) + FALLBACK_ENCODINGS:
+        if _decodes(sample, encoding):
+            return encoding, False
+    return "utf-8", False
+
+
+def decode_source(data, encoding=None):
+    """解碼整份內容，回傳 (文字, 編碼, 是否有 BOM, 是否有無法解碼的位元組)
+
+    encoding 為 None 時自動判斷。樣本全是 ASCII 而之後才出現非 UTF-8 的位元組時，
+    以該位置開始的一段重新判斷；仍無法解碼時，把無法解碼的位元組換成 U+FFFD。
+    """
+    detected = encoding is None
+    if detected:
+        encoding, bom = detect_encoding(data)
+    else:
+        bom = False
+        for mark, name in _BOMS:
+            if data.startswith(mark) and codecs.lookup(name).name == codecs.lookup(encoding).name:
+                encoding, bom = name, True
+                break
+    body = data[len(next(mark for mark, name in _BOMS if name == encoding)):] if bom else data
+    try:
+        return body.decode(encoding), encoding, bom, False
+    except UnicodeDecodeError as e:
+        error_start = e.start
+    if detected and not bom and encoding == "utf-8" and data[:SAMPLE_SIZE].isascii():
+        # 樣本沒有任何非 ASCII 字元，UTF-8 只是預設值；樣本已確認是 UTF-8 時只取代無法解碼的位元組
+        retry, _ = detect_encoding(data[error_start:])
+        if retry != "utf-8":
+            try:
+                return data.decode(retry), retry, False, False
+            except UnicodeDecodeError:
+                encoding = retry
+    return body.decode(encoding, errors="replace"), encoding, bom, True
+
+
+def parse_timestamp(text):
+    """把 "時:分:秒"、"分:秒" 或 "秒"（秒可帶小數，逗號或小數點皆可）轉成毫秒"""
+    parts = text.strip().replace(",", ".").split(":")
+    if not 1 <= len(parts) <= 3:
+        raise ValueError(f"無法解析時間: {text}")
+    try:
+        values = [float(part) for part in parts]
+    except ValueError:
+        raise ValueError(f"無法解析時間: {text}") from None
+    seconds = 0.0
+    for value in values:
+        if value < 0:
+            raise ValueError(f"無法解析時間: {text}")
+        seconds = seconds * 60 + value
+    return int(round(seconds * 1000))
+
+
+def parse_time_range(text):
+    """把 "開始-結束"（例如 "00:00-05:00"、"1:00:00-1:10:00"）轉成 (開始毫秒, 結束毫秒)"""
+    start, separator, end = text.partition("-")
+    if not separator:
+        raise ValueError(f"時間範圍應為 開始-結束: {text}")
+    start, end = parse_timestamp(start), parse_timestamp(end)
+    if end <= start:
+        raise ValueError(f"時間範圍的結束必須晚於開始: {text}")
+    return start, end
+
+
+def parse_srt(data, encoding=None):
+    """解析 SRT 檔的位元組內容，encoding 為 None 時自動判斷編碼"""
+    return SrtDocument(*decode_source(data, encoding))
+
+
+def read_cues(file_path, encoding=None, detach=False):
+    """讀取 SRT 檔，回傳 (SrtDocument, 各句原文, 正規化後的原文)
+
+    detach 為 True 時（在子行程中讀取）回傳的 SrtDocument 不含原文，不必把整份原文傳回主行程。
+    """
+    with open(file_path, "rb") as f:
+        document = parse_srt(f.read(), encoding)
+    texts = document.texts()
+    if detach:
+        document = document.detach(file_path)
+    return document, texts, [normalize_text(text) for text in texts]
+
+
+def write_cues(output_path, document, texts, encoding="utf-8"):
+    """把譯文套用到 document 後寫出；原檔有 BOM 時，輸出為 UTF 編碼也加上 BOM
+
+    encoding 為 "source" 時使用原檔的編碼，譯文無法以該編碼表示時拋出 UnicodeEncodeError。
+
+    先寫到暫存檔再改名，讀取輸出檔的程式不會看到寫到一半的內容。
+    """
+    if encoding == "source":
+        encoding = document.encoding
+    if document.source is None:
+        document.attach()
+    content = document.render(texts)
+    if document.bom and codecs.lookup(encoding).name in _BOM_ENCODINGS:
+        content = "\ufeff" + content
+    temp_path = output_path + ".tmp"
+    try:
+        with open(temp_path, "w", encoding=encoding, newline="") as f:
+            f.write(content)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        # 例如譯文無法以指定的編碼表示：不留下寫到一半的暫存檔
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
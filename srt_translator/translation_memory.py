@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".srt_translator", "translation_memory.sqlite3")
+
+
+def normalize_text(text):
+    """統一換行與空白，讓只差在空白的字幕視為同一句"""
+    return "\n".join(" ".join(line.split()) for line in text.strip().splitlines())
+
+
+def make_key(model_name, target_lang, prompt_version, text, context=None):
+    """以模型、目標語言、提示版本、正規化後的原文與上下文組成快取鍵"""
+    parts = [model_name, target_lang, prompt_version, normalize_text(text)]
+    if context is not None:
+        parts.append([normalize_text(t) for t in context])
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class TranslationMemory:
+    """保存在 SQLite 中的翻譯記憶
+
+    重複出現的字幕（跨檔案或重新翻譯時）直接取用先前的譯文，不再呼叫模型。
+    超過 max_entries 時依最後使用時間淘汰最舊的項目（LRU）。
+    可安全地從多個執行緒使用；get_many、put_many 在一次交易中處理多筆，
+    讓翻譯工作能把查詢與寫入整批交給背景執行緒。
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=200000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "key TEXT PRIMARY KEY, translation TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT translation FROM translations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE translations SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def get_many(self, keys):
+        """查詢多筆，回傳 {鍵: 譯文}（只含命中的鍵）"""
+        found = {}
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for key in keys:
+                    row = self._conn.execute("SELECT translation FROM translations WHERE key = ?", (key,)).fetchone()
+                    if row is None:
+                        self.misses += 1
+                        continue
+                    self.hits += 1
+                    found[key] = row[0]
+                if found:
+                    now = time.time()
+                    self._conn.executemany("UPDATE translations SET last_used = ? WHERE key = ?",
+                                           [(now, key) for key in found])
+            finally:
+                self._conn.execute("COMMIT")
+        return found
+
+    def put_many(self, items):
+        """寫入多筆 (鍵, 譯文)"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for key, translation in items:
+                    self._put(key, translation)
+            finally:
+                self._conn.execute("COMMIT")
+
+    def put(self, key, translation):
+        with self._lock:
+            self._put(key, translation)
+
+    def _put(self, key, translation):
+        """呼叫端須持有 _lock"""
+        inserted = self._conn.execute(
+            "INSERT OR IGNORE INTO translations (key, translation, last_used) VALUES (?, ?, ?)",
+            (key, translation, time.time()),
+        ).rowcount
+        if not inserted:
+            self._conn.execute(
+                "UPDATE translations SET translation = ?, last_used = ? WHERE key = ?",
+                (translation, time.time(), key),
+            )
+            return
+        self._entries += 1
+        if self._entries > self.max_entries:
+            # 一次多淘汰一成，避免之後每寫一筆就要清一次
+            evict = self._entries - self.max_entries + self.max_entries // 10
+            self._conn.execute(
+                "DELETE FROM translations WHERE key IN "
+                "(SELECT key FROM translations ORDER BY last_used LIMIT ?)",
+                (evict,),
+            )
+            self._entries = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
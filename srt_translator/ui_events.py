@@ -0,0 +1,71 @@
+import collections
+import threading
+
+# 介面執行緒處理事件的間隔（毫秒），進度畫面每秒最多更新 20 次
+UI_REFRESH_MS = 50
+
+# drain() 一次取出的介面更新
+UiUpdates = collections.namedtuple("UiUpdates", "progress partial overall events")
+
+
+class UiEventQueue:
+    """工作執行緒與介面執行緒之間的事件通道
+
+    翻譯工作與排程器在自己的執行緒中呼叫 progress_callback、overall_callback 與
+    completion_callback(檔案路徑) 產生的回呼，這些方法只把事件記下來，不碰任何元件；
+    介面執行緒以計時器每 UI_REFRESH_MS 毫秒呼叫一次 drain() 取出並套用。
+
+    進度與串流中的譯文在兩次 drain() 之間只保留每個檔案最新的一筆，整體進度只保留
+    最新值，不論有多少檔案同時翻譯，介面每個間隔都只更新一次；完成訊息、檔案衝突
+    詢問與 post() 加入的其他事件則依序保留，不會被合併掉。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._progress = {}  # 檔案路徑 -> (已完成句數, 總句數)
+        self._partial = {}  # 檔案路徑 -> 串流中的譯文
+        self._overall = None  # (已完成句數, 總句數)
+        self._events = []  # 依序處理的事件
+
+    def progress_callback(self, current, total, extra_data=None):
+        """TranslationJob 的 progress_callback"""
+        extra_data = extra_data or {}
+        kind = extra_data.get("type")
+        with self._lock:
+            if kind == "file_conflict":
+                self._events.append(extra_data)
+            elif kind == "partial":
+                self._progress[extra_data["path"]] = (current, total)
+                self._partial[extra_data["path"]] = extra_data["text"]
+            elif "path" in extra_data:
+                self._progress[extra_data["path"]] = (current, total)
+                # 這句已經翻完，串流中的譯文不再適用
+                self._partial.pop(extra_data["path"], None)
+
+    def overall_callback(self, done, total):
+        """TranslationDispatcher 的 progress_callback"""
+        with self._lock:
+            self._overall = (done, total)
+
+    def completion_callback(self, file_path):
+        """回傳給 file_path 的翻譯工作使用的 complete_callback"""
+        def on_complete(message):
+            with self._lock:
+                self._partial.pop(file_path, None)
+                self._events.append({"type": "file_done", "path": file_path, "message": message})
+        return on_complete
+
+    def post(self, event):
+        """加入一個依序處理的事件（dict，至少要有 type）"""
+        with self._lock:
+            self._events.append(event)
+
+    def drain(self):
+        """取出上次呼叫之後累積的更新（只應在介面執行緒中呼叫）"""
+        with self._lock:
+            updates = UiUpdates(self._progress, self._partial, self._overall, self._events)
+            self._progress = {}
+            self._partial = {}
+            self._overall = None
+            self._events = []
+        return updates
@@ -0,0 +1,216 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+from .job import TranslationJob
+
+# inotify 事件（見 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class _Inotify:
+    """以 ctypes 呼叫 Linux 的 inotify，其他平台或無法建立時 create() 回傳 None"""
+
+    def __init__(self, libc, fd):
+        self._libc = libc
+        self.fd = fd
+        self.directories = {}  # watch descriptor -> 資料夾
+
+    @classmethod
+    def create(cls):
+        if not hasattr(select, "poll"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        return cls(libc, fd) if fd >= 0 else None
+
+    def add(self, directory):
+        """監看一個資料夾，失敗（例如超過 max_user_watches）時回傳 False"""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            return False
+        self.directories[wd] = directory
+        return True
+
+    def read(self, timeout):
+        """等待最多 timeout 秒，回傳 [(資料夾, 檔名, mask)]"""
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN)
+        if not poller.poll(timeout * 1000):
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)  # 資料夾已刪除
+            events.append((self.directories.get(wd), name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher(threading.Thread):
+    """監看資料夾，把新出現且已寫完的 SRT 檔交給 on_file
+
+    Linux 上使用 inotify，其他平台、無法建立 inotify 或 use_inotify 為 False 時
+    改為每 poll_interval 秒掃描一次。啟動時先掃描一次，已經在資料夾中的檔案也會處理。
+    複製中的檔案大小或修改時間會一直改變，要連續 settle 秒都沒有變動才視為寫完；
+    同一個檔案內容沒變時不會重複交出。
+    翻譯輸出檔（檔名以任何目標語言後綴加 .srt 結尾）、隱藏檔，以及已經有
+    target_lang 輸出檔（TranslationJob.default_output_path）的原檔都會略過，
+    後者交給 on_skip（若有提供）。on_file 與 on_skip 在監看執行緒中呼叫。
+    """
+
+    check_interval = 0.5  # 檢查候選檔案是否寫完的間隔秒數
+
+    def __init__(self, directories, on_file, target_lang="繁體中文", recursive=True,
+                 settle=2.0, poll_interval=5.0, use_inotify=True, on_skip=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.on_file = on_file
+        self.on_skip = on_skip
+        self.target_lang = target_lang
+        self.recursive = recursive
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.mode = None  # 實際使用的方式：inotify 或 polling
+        self.ready = threading.Event()  # 決定好 mode 後設定
+
+        self._output_suffixes = tuple(suffix + ".srt" for suffix in TranslationJob.LANG_SUFFIXES.values())
+        self._candidates = {}  # 路徑 -> (檔案狀態, 最後一次變動的時間)
+        self._seen = {}  # 已處理的路徑 -> 處理時的檔案狀態
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        inotify = _Inotify.create() if self.use_inotify else None
+        if inotify is not None:
+            for directory in self.directories:
+                if not self._watch_tree(inotify, directory):
+                    inotify.close()
+                    inotify = None
+                    break
+        self.mode = "polling" if inotify is None else "inotify"
+        self.ready.set()
+
+        self._scan(self.directories)
+        next_scan = time.monotonic() + self.poll_interval
+        try:
+            while not self._stop_event.is_set():
+                if inotify is not None:
+                    self._handle_events(inotify, inotify.read(self.check_interval))
+                else:
+                    self._stop_event.wait(self.check_interval)
+                    if time.monotonic() >= next_scan:
+                        self._scan(self.directories)
+                        next_scan = time.monotonic() + self.poll_interval
+                self._emit_stable()
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _watch_tree(self, inotify, directory):
+        if not inotify.add(directory):
+            return False
+        if self.recursive:
+            for root, dirs, _ in os.walk(directory):
+                for name in dirs:
+                    if not inotify.add(os.path.join(root, name)):
+                        return False
+        return True
+
+    def _handle_events(self, inotify, events):
+        for directory, name, mask in events:
+            if mask & IN_Q_OVERFLOW:
+                # 事件太多來不及讀，可能漏掉檔案，全部重新掃描
+                self._scan(self.directories)
+            elif directory is None or not name:
+                continue
+            elif mask & IN_ISDIR:
+                path = os.path.join(directory, name)
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    # 新資料夾：開始監看，並處理在監看前就已經放進去的檔案
+                    self._watch_tree(inotify, path)
+                    self._scan([path])
+            else:
+                self._touch(os.path.join(directory, name))
+
+    def _scan(self, directories):
+        for directory in directories:
+            if self.recursive:
+                walker = os.walk(directory)
+            else:
+                walker = [(directory, [], os.listdir(directory))] if os.path.isdir(directory) else []
+            for root, _, files in walker:
+                for name in files:
+                    self._touch(os.path.join(root, name))
+
+    def _wanted(self, path):
+        name = os.path.basename(path)
+        lower = name.lower()
+        return lower.endswith(".srt") and not lower.endswith(self._output_suffixes) and not name.startswith(".")
+
+    def _touch(self, path):
+        """檔案可能有變動，列為候選"""
+        if path in self._candidates or not self._wanted(path):
+            return
+        if path in self._seen:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return
+            if self._seen[path] == (stat.st_size, stat.st_mtime_ns):
+                return  # 已處理過，內容沒有變動
+        self._candidates[path] = (None, time.monotonic())
+
+    def _emit_stable(self):
+        now = time.monotonic()
+        for path, (state, changed) in list(self._candidates.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._candidates[path]  # 已刪除或改名
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != state:
+                self._candidates[path] = (current, now)
+                continue
+            if now - changed < self.settle or not stat.st_size:
+                continue
+            del self._candidates[path]
+            if self._seen.get(path) == current:
+                continue
+            self._seen[path] = current
+            if os.path.exists(TranslationJob.default_output_path(path, self.target_lang)):
+                if self.on_skip is not None:
+                    self.on_skip(path)
+            else:
+                self.on_file(path)
@@ -0,0 +1,139 @@
+import codecs
+import os
+import tempfile
+import unittest
+
+from srt_translator.srt_io import SAMPLE_SIZE, decode_source, parse_srt, read_cues, write_cues
+
+
+def _cue(number, text):
+    return f"{number}\n00:00:{number % 60:02d},000 --> 00:00:{number % 60:02d},500\n{text}\n\n"
+
+
+class DecodeSourceTest(unittest.TestCase):
+    def test_utf8_sample_with_late_invalid_bytes_keeps_utf8(self):
+        # 樣本是含非 ASCII 字元的 UTF-8，之後混入一段 CP932：只有那段變成 U+FFFD
+        head = "".join(_cue(n, "ちょっと待って") for n in range(1, 3000)).encode("utf-8")
+        self.assertGreater(len(head), SAMPLE_SIZE)
+        data = head + _cue(3000, "ちょっと").encode("cp932")
+        text, encoding, bom, lossy = decode_source(data)
+        self.assertEqual((encoding, bom, lossy), ("utf-8", False, True))
+        document = parse_srt(data)
+        self.assertEqual(document.text(0), "ちょっと待って")
+        self.assertIn("�", document.text(len(document) - 1))
+
+    def test_ascii_sample_with_late_cp932_is_redetected(self):
+        head = "".join(_cue(n, "wait") for n in range(1, 4000)).encode("ascii")
+        self.assertGreater(len(head), SAMPLE_SIZE)
+        data = head + _cue(4000, "ちょっと待って").encode("cp932")
+        text, encoding, bom, lossy = decode_source(data)
+        self.assertEqual((encoding, lossy), ("cp932", False))
+        self.assertTrue(text.endswith("ちょっと待って\n\n"))
+
+
+class ParseSrtTest(unittest.TestCase):
+    def test_timings_and_texts(self):
+        document = parse_srt(b"1\n00:00:01,000 --> 00:00:02,500\nHello\nworld\n\n"
+                             b"2\n01:02:03.004 --> 01:02:04,5 X1:10 X2:20\nBye\n")
+        self.assertEqual(len(document), 2)
+        self.assertEqual(document.texts(), ["Hello\nworld", "Bye"])
+        self.assertEqual(list(document.starts), [1000, 3723004])
+        self.assertEqual(list(document.ends), [2500, 3724005])  # 一位數的小數與 pysrt 相同，視為毫秒
+
+    def test_crlf_and_bom(self):
+        document = parse_srt(codecs.BOM_UTF8 + b"1\r\n00:00:01,000 --> 00:00:02,000\r\nA\r\nB\r\n\r\n")
+        self.assertTrue(document.bom)
+        self.assertEqual(document.newline, "\r\n")
+        self.assertEqual(document.texts(), ["A\nB"])
+
+    def test_missing_trailing_blank_line_and_newline(self):
+        document = parse_srt(b"1\n00:00:01,000 --> 00:00:02,000\nA\n2\n00:00:03,000 --> 00:00:04,000\nB")
+        self.assertEqual(document.texts(), ["A", "B"])
+
+    def test_empty_cue(self):
+        document = parse_srt(b"1\n00:00:01,000 --> 00:00:02,000\n\n2\n00:00:03,000 --> 00:00:04,000\nB\n")
+        self.assertEqual(document.texts(), ["", "B"])
+
+    def test_malformed_block_is_not_a_cue(self):
+        document = parse_srt(b"garbage\nblock\n\n1\n00:00:01,000 --> 00:00:02,000\nA\n\n"
+                             b"2\n00:00:03 --> 00:00:04\nno milliseconds\n")
+        self.assertEqual(document.texts(), ["A"])
+
+
+class WriteCuesTest(unittest.TestCase):
+    SAMPLES = {
+        "lf": b"1\n00:00:01,000 --> 00:00:02,000\nA\n\n2\n00:00:03,000 --> 00:00:04,000\nB\nC\n\n",
+        "crlf": b"1\r\n00:00:01,000 --> 00:00:02,000\r\nA\r\n\r\n2\r\n00:00:03,000 --> 00:00:04,000\r\nB\r\n",
+        "bom": codecs.BOM_UTF8 + b"1\n00:00:01,000 --> 00:00:02,000\nA\n",
+        "no_trailing_newline": b"1\n00:00:01,000 --> 00:00:02,000\nA\n2\n00:00:03,000 --> 00:00:04,000\nB",
+        "empty_cue": b"1\n00:00:01,000 --> 00:00:02,000\n\n2\n00:00:03,000 --> 00:00:04,000\nB\n",
+        "malformed": b"note\n\n1\n00:00:01,000 --> 00:00:02,000 X1:1\n<i>A</i>\n\n\n\n2\n00:00:03 --> 4\nx\n",
+        "utf16": "1\r\n00:00:01,000 --> 00:00:02,000\r\nあ\r\n".encode("utf-16"),
+    }
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def round_trip(self, data, change=None, encoding="source"):
+        source_path = os.path.join(self.directory.name, "in.srt")
+        output_path = os.path.join(self.directory.name, "out.srt")
+        with open(source_path, "wb") as f:
+            f.write(data)
+        document, texts, _ = read_cues(source_path)
+        if change is not None:
+            texts = [change(text) for text in texts]
+        write_cues(output_path, document, texts, encoding)
+        with open(output_path, "rb") as f:
+            return f.read()
+
+    def test_unchanged_texts_are_byte_identical(self):
+        for name, data in self.SAMPLES.items():
+            with self.subTest(name):
+                self.assertEqual(self.round_trip(data), data)
+
+    def test_detached_document_is_byte_identical(self):
+        source_path = os.path.join(self.directory.name, "in.srt")
+        output_path = os.path.join(self.directory.name, "out.srt")
+        for name, data in self.SAMPLES.items():
+            with self.subTest(name):
+                with open(source_path, "wb") as f:
+                    f.write(data)
+                document, texts, _ = read_cues(source_path, detach=True)
+                self.assertIsNone(document.source)
+                write_cues(output_path, document, texts, "source")
+                with open(output_path, "rb") as f:
+                    self.assertEqual(f.read(), data)
+
+    def test_only_texts_are_replaced(self):
+        self.assertEqual(
+            self.round_trip(self.SAMPLES["crlf"], lambda text: "T:" + text + "\n2"),
+            b"1\r\n00:00:01,000 --> 00:00:02,000\r\nT:A\r\n2\r\n\r\n"
+            b"2\r\n00:00:03,000 --> 00:00:04,000\r\nT:B\r\n2\r\n")
+        self.assertEqual(
+            self.round_trip(self.SAMPLES["no_trailing_newline"], str.lower),
+            b"1\n00:00:01,000 --> 00:00:02,000\na\n2\n00:00:03,000 --> 00:00:04,000\nb")
+
+    def test_empty_cue_gets_text(self):
+        self.assertEqual(
+            self.round_trip(self.SAMPLES["empty_cue"], lambda text: text or "new"),
+            b"1\n00:00:01,000 --> 00:00:02,000\nnew\n\n2\n00:00:03,000 --> 00:00:04,000\nB\n")
+        # 最後一句沒有文字：檔案原本以換行結尾時譯文後也加上換行
+        self.assertEqual(self.round_trip(b"1\n00:00:01,000 --> 00:00:02,000\n", lambda text: "new"),
+                         b"1\n00:00:01,000 --> 00:00:02,000\nnew\n")
+        self.assertEqual(self.round_trip(b"1\n00:00:01,000 --> 00:00:02,000", lambda text: "new"),
+                         b"1\n00:00:01,000 --> 00:00:02,000\nnew")
+
+    def test_bom_kept_for_utf_output(self):
+        output = self.round_trip(self.SAMPLES["bom"], lambda text: "譯", "utf-8")
+        self.assertEqual(output, codecs.BOM_UTF8 + "1\n00:00:01,000 --> 00:00:02,000\n譯\n".encode("utf-8"))
+
+    def test_unencodable_output_leaves_no_temp_file(self):
+        data = "1\n00:00:01,000 --> 00:00:02,000\nあ\n".encode("cp932")
+        with self.assertRaises(UnicodeEncodeError):
+            self.round_trip(data, lambda text: "譯\U0001f600", "source")
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["in.srt"])
+
+
+if __name__ == "__main__":
+    unittest.main()